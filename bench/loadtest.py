@@ -0,0 +1,318 @@
+# লোড-টেস্ট হারনেস: আসল হ্যান্ডলারগুলো stub Bot/Update ও নকল Telethon event দিয়ে লোকাল SQLite-এ চালিয়ে
+# throughput ও latency percentile JSON আকারে লেখে।
+# ব্যবহার: python bench/loadtest.py --presses 10000 --otps 5000 --output loadtest.json
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubMessage:
+    def __init__(self, bot, chat_id, text=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(chat_id=self.chat_id, text=text, **kwargs)
+
+    async def edit_text(self, text, **kwargs):
+        await self.bot.call_api()
+        self.text = text
+        return self
+
+
+class StubBot:
+    # Bot API-র রাউন্ড-ট্রিপ asyncio.sleep দিয়ে নকল করা হয়
+    def __init__(self, api_latency):
+        self.api_latency = api_latency
+        self.sent = 0
+        self.sent_at = {}
+
+    async def call_api(self):
+        if self.api_latency: await asyncio.sleep(self.api_latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.call_api()
+        self.sent += 1
+        self.sent_at[chat_id] = time.perf_counter()
+        return StubMessage(self, chat_id, text)
+
+
+def make_update(bot, user_id, text=None):
+    user = SimpleNamespace(id=user_id, first_name=f"User{user_id}", full_name=f"Load User {user_id}")
+    return SimpleNamespace(effective_user=user, effective_chat=SimpleNamespace(id=user_id), message=StubMessage(bot, user_id, text))
+
+
+def make_context(bot, args=None, user_data=None):
+    return SimpleNamespace(
+        bot=bot, args=args or [], user_data=user_data or {},
+        application=SimpleNamespace(create_task=asyncio.ensure_future),
+    )
+
+
+def make_channel_event(text):
+    # Telethon-এর NewMessage event-এর যেটুকু forwarder_handler পড়ে
+    return SimpleNamespace(message=SimpleNamespace(text=text))
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    summary = {"count": len(latencies), "seconds": round(elapsed, 3), "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None}
+    if latencies:
+        for name, fraction in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            summary[name] = round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 3)
+        summary["max_ms"] = round(latencies[-1] * 1000, 3)
+    return summary
+
+
+async def run_concurrently(calls, concurrency):
+    # PTB-র concurrent_updates-এর মতো একসাথে সর্বোচ্চ concurrency-টি হ্যান্ডলার চলে
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(call):
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def get_number_workload(main, bot, presses, users, concurrency):
+    first_user_id = 1_000_000
+    calls = [
+        (lambda user_id=first_user_id + press % users: main.handle_get_number_message(make_update(bot, user_id, main.BTN_GET_NUMBER), make_context(bot)))
+        for press in range(presses)
+    ]
+    return await run_concurrently(calls, concurrency)
+
+
+async def otp_burst_workload(main, bot, otps, concurrency):
+    with main.db_session() as db:
+        assignments = db.query(main.ActiveAssignment.number, main.ActiveAssignment.user_id).limit(otps).all()
+    received_at = {}
+
+    def forward(number, user_id):
+        async def call():
+            received_at[user_id] = time.perf_counter()
+            await main.forwarder_handler(make_channel_event(f"Your WhatsApp code is 482-913 for +{number}. Don't share it."))
+        return call
+
+    bot.sent_at.clear()
+    started = time.perf_counter()
+    handler_summary = await run_concurrently([forward(number, user_id) for number, user_id in assignments], concurrency)
+    await main.otp_delivery_queue.join()
+    while main.otp_settle_queue.qsize() or main.otp_numbers_in_flight:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    delivery_latencies = [bot.sent_at[user_id] - received_at[user_id] for user_id in received_at if user_id in bot.sent_at]
+    return {"forwarder_handler": handler_summary, "delivered_and_settled": summarize(delivery_latencies, elapsed)}
+
+
+async def withdraw_workload(main, bot, withdrawals, concurrency):
+    user_ids = list(range(2_000_000, 2_000_000 + withdrawals))
+    for user_id in user_ids: main.add_or_update_user(user_id)
+    with main.db_session() as db:
+        main.credit_user_balances(db, {user_id: 100_00 for user_id in user_ids}, "loadtest")
+    withdraw_data = {"withdraw_method": "recharge", "withdraw_details": "01711000000"}
+    amount = str(main.MIN_WITHDRAW["recharge"])
+    calls = [
+        (lambda user_id=user_id: main.confirm_withdraw(make_update(bot, user_id, amount), make_context(bot, user_data=dict(withdraw_data))))
+        for user_id in user_ids
+    ]
+    return await run_concurrently(calls, concurrency)
+
+
+async def broadcast_workload(main, bot, rate):
+    if rate: main.broadcast_bucket = main.TokenBucket(rate)
+    all_user_ids = main.get_all_user_ids()
+    sent_before = bot.sent
+    started = time.perf_counter()
+    context = make_context(bot, args=["loadtest", "broadcast"])
+    tasks = []
+    context.application.create_task = lambda coro: tasks.append(asyncio.ensure_future(coro))
+    await main.broadcast_command(make_update(bot, main.ADMIN_USER_ID, "/broadcast loadtest broadcast"), context)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {"recipients": len(all_user_ids), "messages_sent": bot.sent - sent_before, "seconds": round(elapsed, 3),
+            "throughput_per_s": round(len(all_user_ids) / elapsed, 1) if elapsed else None}
+
+
+async def run_loadtest(main, args):
+    bot = StubBot(args.api_latency)
+    main.setup_database()
+    numbers = [str(8801500000000 + offset) for offset in range(args.presses)]
+    main.add_numbers_to_db(numbers)
+    main.reconcile_stock_counter()
+    main.start_otp_pipeline(bot)
+
+    results = {}
+    results["get_number"] = await get_number_workload(main, bot, args.presses, args.users or args.presses, args.concurrency)
+    results["otp_burst"] = await otp_burst_workload(main, bot, args.otps, args.concurrency)
+    results["confirm_withdraw"] = await withdraw_workload(main, bot, args.withdrawals, args.concurrency)
+    results["broadcast"] = await broadcast_workload(main, bot, args.broadcast_rate)
+
+    for task in main.otp_pipeline_tasks: task.cancel()
+    return results
+
+
+async def run_delivery_child(main, args):
+    # BOT_ROLE=delivery প্রসেসের মতো: otp_events থেকে দাবি করে stub Bot দিয়ে পাঠায়
+    main.start_otp_pipeline(StubBot(args.api_latency))
+    print("ready", flush=True)
+    sys.stdout = open(os.devnull, "w")
+    await main.otp_event_consumer()
+
+
+def count_rows(main, model):
+    with main.db_session() as db:
+        return db.query(model).count()
+
+
+def delivery_scaling_workload(main, args):
+    # একই otp_events টেবিলে 1/2/4... টি আলাদা delivery প্রসেস চালিয়ে events/s মাপা হয়
+    main.setup_database()
+    with main.db_session() as db:
+        db.query(main.ActiveAssignment).delete()
+        db.query(main.OtpEvent).delete()
+    user_ids = list(range(4_000_000, 4_000_000 + 500))
+    for user_id in user_ids: main.add_or_update_user(user_id)
+    results = {}
+    for run, worker_count in enumerate(int(count) for count in args.delivery_workers.split(",")):
+        numbers = [str(8801400000000 + run * 1_000_000 + offset) for offset in range(args.events)]
+        with main.db_session() as db:
+            db.execute(main.insert(main.ActiveAssignment), [
+                {"number": number, "user_id": user_ids[offset % len(user_ids)], "timestamp": time.time()}
+                for offset, number in enumerate(numbers)
+            ])
+
+        workers = [
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--delivery-worker-child", "--api-latency", str(args.api_latency)],
+                             stdout=subprocess.PIPE, text=True, env=os.environ | {"BOT_ROLE": "delivery"})
+            for _ in range(worker_count)
+        ]
+        try:
+            for worker in workers: worker.stdout.readline()
+            started = time.perf_counter()
+            for offset in range(0, len(numbers), main.BULK_INSERT_BATCH_SIZE):
+                main.enqueue_otp_events([(f"+{number}", number) for number in numbers[offset:offset + main.BULK_INSERT_BATCH_SIZE]],
+                                        "Your WhatsApp code is 482-913", time.time())
+            # সব event পাঠানো ও settle (অ্যাসাইনমেন্ট মুছে ব্যালেন্স যোগ) হওয়া পর্যন্ত
+            while (count_rows(main, main.OtpEvent) or count_rows(main, main.ActiveAssignment)) and time.perf_counter() - started < args.timeout:
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            remaining = count_rows(main, main.OtpEvent)
+        finally:
+            for worker in workers: worker.terminate()
+            for worker in workers: worker.wait()
+        settled = args.events - count_rows(main, main.ActiveAssignment)
+        results[f"{worker_count}_workers"] = {"events": args.events, "settled": settled, "unsent": remaining,
+                                              "seconds": round(elapsed, 3), "events_per_s": round(settled / elapsed, 1)}
+        with main.db_session() as db:
+            db.query(main.ActiveAssignment).delete()
+            db.query(main.OtpEvent).delete()
+    return results
+
+
+def import_workload(main, args):
+    # অ্যাডমিনের আপলোড করা ফাইলের মতো: প্রতি লাইনে একটি নাম্বার, কিছু ডুপ্লিকেট ও কিছু অবৈধ লাইন
+    path = os.path.join(tempfile.mkdtemp(prefix="otp-import-"), "numbers.csv")
+    with open(path, "w") as f:
+        for line in range(args.import_lines):
+            if line % 50 == 0: f.write("12345\n")
+            elif line % 20 == 0: f.write(f"+880 1{(line - 1) % 1_000_000_000:09d}\n")
+            else: f.write(f"+880 1{line % 1_000_000_000:09d}\n")
+    main.clear_all_numbers_from_db()
+    started = time.perf_counter()
+    added_count, duplicate_count, rejected_count = main.import_numbers_file(path)
+    elapsed = time.perf_counter() - started
+    return {"lines": args.import_lines, "added": added_count, "duplicates": duplicate_count, "rejected": rejected_count,
+            "seconds": round(elapsed, 3), "rows_per_s": round(args.import_lines / elapsed, 1)}
+
+
+def claim_latency_workload(main, args):
+    # স্টকে 1k থেকে 1M নাম্বার রেখে reserve_number_for_user-এর latency; DELETE ... RETURNING index দিয়ে চলে, তাই প্রায় সমান থাকা উচিত
+    results = {}
+    for stock_size in (int(size) for size in args.claim_stock.split(",")):
+        main.clear_all_numbers_from_db()
+        for offset in range(0, stock_size, main.BULK_INSERT_BATCH_SIZE):
+            main.add_numbers_to_db([str(8801000000000 + number) for number in range(offset, min(offset + main.BULK_INSERT_BATCH_SIZE, stock_size))])
+        latencies = []
+        started = time.perf_counter()
+        for user_id in range(5_000_000, 5_000_000 + min(args.claims, stock_size)):
+            claim_started = time.perf_counter()
+            assert main.reserve_number_for_user(user_id)
+            latencies.append(time.perf_counter() - claim_started)
+        results[f"{stock_size}_stocked"] = summarize(latencies, time.perf_counter() - started) | {"claim_mode": main.NUMBER_CLAIM_MODE}
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="main.py-র হ্যান্ডলারগুলোর লোড-টেস্ট (লাইভ Telegram ছাড়া)")
+    parser.add_argument("--presses", type=int, default=10_000, help="Get Number চাপ (স্টকেও এতগুলো নাম্বার থাকে)")
+    parser.add_argument("--users", type=int, default=0, help="কতজন আলাদা ইউজার চাপবে; 0 মানে প্রতি চাপে নতুন ইউজার")
+    parser.add_argument("--otps", type=int, default=5_000, help="চ্যানেলে কতগুলো OTP মেসেজ একসাথে আসবে")
+    parser.add_argument("--withdrawals", type=int, default=1_000)
+    parser.add_argument("--broadcast-rate", type=float, default=2_000,
+                        help="ব্রডকাস্টের মেসেজ/সেকেন্ড সীমা; 0 দিলে BROADCAST_RATE (25/s-এ সব ইউজারে কয়েক মিনিট লাগে)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--api-latency", type=float, default=0.005, help="প্রতিটি Bot API কলের নকল latency (সেকেন্ড)")
+    parser.add_argument("--events", type=int, default=5_000, help="delivery scaling-এ প্রতিবার কতগুলো otp_events")
+    parser.add_argument("--delivery-workers", default="1,2,4", help="কমা দিয়ে আলাদা delivery প্রসেসের সংখ্যা")
+    parser.add_argument("--timeout", type=float, default=300, help="প্রতিটি delivery scaling রানের সর্বোচ্চ সময় (সেকেন্ড)")
+    parser.add_argument("--import-lines", type=int, default=50_000, help="import_numbers_file-এর জন্য তৈরি ফাইলের লাইন সংখ্যা")
+    parser.add_argument("--claim-stock", default="1000,100000,1000000", help="কমা দিয়ে আলাদা স্টকের আকার, প্রতিটিতে claim latency মাপা হয়")
+    parser.add_argument("--claims", type=int, default=1_000, help="প্রতিটি স্টকের আকারে কতবার নাম্বার নেওয়া হবে")
+    parser.add_argument("--delivery-worker-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="JSON ফলাফল এই ফাইলে লেখা হবে; না দিলে stdout-এ")
+    return parser.parse_args()
+
+
+def load_bot_main(**env):
+    # main.py কনফিগারেশন ইমপোর্টের সময় পড়ে, তাই env আগে সেট করতে হয়
+    os.environ["BOT_OFFLINE"] = "1"
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='otp-loadtest-'), 'loadtest.db')}")
+    os.environ.setdefault("ADMIN_USER_ID", "1")
+    for name, value in env.items(): os.environ.setdefault(name, value)
+    sys.path.insert(0, REPO_ROOT)
+    import main as bot_main
+    return bot_main
+
+
+def write_report(bot_main, args, workloads):
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"} | {"database": bot_main.engine.dialect.name},
+        "workloads": workloads,
+    }
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(report + "\n")
+    print(report)
+
+
+def main():
+    args = parse_args()
+    bot_main = load_bot_main()
+    if args.delivery_worker_child:
+        asyncio.run(run_delivery_child(bot_main, args))
+        return
+    workloads = asyncio.run(run_loadtest(bot_main, args))
+    workloads["delivery_scaling"] = delivery_scaling_workload(bot_main, args)
+    workloads["import"] = import_workload(bot_main, args)
+    workloads["claim_latency"] = claim_latency_workload(bot_main, args)
+    write_report(bot_main, args, workloads)
+
+
+if __name__ == "__main__":
+    main()
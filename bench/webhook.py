@@ -0,0 +1,109 @@
+# webhook মোডের লোড-টেস্ট: build_webhook_app-এর /telegram রুটে httpx দিয়ে সিনথেটিক update POST করে
+# গ্রহণ ও প্রসেস হওয়ার হার (updates/s) এবং POST latency JSON আকারে লেখে।
+# ব্যবহার: python bench/webhook.py --updates 5000 --chats 500 --output webhook.json
+import argparse
+import asyncio
+import time
+
+import httpx
+from telegram import Bot, User
+
+from loadtest import load_bot_main, summarize, write_report
+
+
+class StubTelegramBot(Bot):
+    # নেটওয়ার্কে না গিয়ে Bot API কলগুলোর উত্তর দেয়; handler-দের reply এখানেই আসে
+    def __init__(self, token, api_latency):
+        super().__init__(token)
+        with self._unfrozen():
+            self.api_latency = api_latency
+            self.replies = []
+
+    async def initialize(self):
+        with self._unfrozen():
+            self._bot_user = User(id=1, is_bot=True, first_name="Load", username="loadtest_bot")
+            self._initialized = True
+
+    async def shutdown(self):
+        with self._unfrozen():
+            self._initialized = False
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        self.replies.append(time.perf_counter())
+
+
+def make_update_json(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"},
+        },
+    }
+
+
+async def run_webhook_load(bot_main, args):
+    bot_main.setup_database()
+    bot_main.add_numbers_to_db([str(8801500000000 + offset) for offset in range(args.chats)])
+    bot_main.reconcile_stock_counter()
+
+    bot = StubTelegramBot("123456:LOADTEST", args.api_latency)
+    ptb_app = bot_main.build_ptb_app(bot)
+    web_app = bot_main.build_webhook_app(ptb_app)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": bot_main.WEBHOOK_SECRET}
+    first_chat_id = 3_000_000
+    # প্রতিটি চ্যাটের প্রথম update Get Number, বাকিগুলো ব্যালেন্স দেখা (একই চ্যাটে ক্রমানুসারে চলে)
+    updates = [
+        make_update_json(update_id, first_chat_id + update_id % args.chats,
+                         bot_main.BTN_GET_NUMBER if update_id < args.chats else bot_main.BTN_BALANCE)
+        for update_id in range(args.updates)
+    ]
+
+    async with ptb_app:
+        await ptb_app.start()
+        post_latencies = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://webhook.local") as client:
+            async def post(update_json):
+                async with semaphore:
+                    posted = time.perf_counter()
+                    response = await client.post("/telegram", json=update_json, headers=headers)
+                    response.raise_for_status()
+                    post_latencies.append(time.perf_counter() - posted)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(update_json) for update_json in updates))
+            accepted_seconds = time.perf_counter() - started
+            while len(bot.replies) < args.updates and time.perf_counter() - started < args.timeout:
+                await asyncio.sleep(0.01)
+            processed_seconds = time.perf_counter() - started
+        await ptb_app.stop()
+
+    return {
+        "webhook_post": summarize(post_latencies, accepted_seconds),
+        "processed": {"count": len(bot.replies), "seconds": round(processed_seconds, 3),
+                      "updates_per_s": round(len(bot.replies) / processed_seconds, 1)},
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="webhook মোডে /telegram রুটের লোড-টেস্ট (লাইভ Telegram ছাড়া)")
+    parser.add_argument("--updates", type=int, default=5_000)
+    parser.add_argument("--chats", type=int, default=500, help="কতগুলো আলাদা চ্যাট থেকে update আসবে")
+    parser.add_argument("--concurrency", type=int, default=64, help="একসাথে কতগুলো POST চলবে")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="প্রতিটি Bot API কলের নকল latency (সেকেন্ড)")
+    parser.add_argument("--timeout", type=float, default=120, help="সব update প্রসেস হওয়ার জন্য সর্বোচ্চ অপেক্ষা (সেকেন্ড)")
+    parser.add_argument("--output", help="JSON ফলাফল এই ফাইলে লেখা হবে; না দিলে stdout-এ")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bot_main = load_bot_main(WEBHOOK_URL="https://webhook.local", TELEGRAM_BOT_TOKEN="123456:LOADTEST")
+    write_report(bot_main, args, asyncio.run(run_webhook_load(bot_main, args)))
+
+
+if __name__ == "__main__":
+    main()
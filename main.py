@@ -1,23 +1,41 @@
 import os
 import time
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread
 import asyncio
 import re
 import random
+import tempfile
+import functools
+import secrets
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict, Counter, deque
+from threading import Lock
 
 # --- নতুন ডাটাবেস লাইব্রেরি ---
-from sqlalchemy import create_engine, Column, Integer, String, Float
+from sqlalchemy import event, create_engine, Column, Integer, BigInteger, String, Float, text, inspect, insert, update, delete, select, bindparam, tuple_
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# --- webhook মোডের ASGI সার্ভারের জন্য লাইব্রেরি ---
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, JSONResponse
+from starlette.routing import Route
+
+# --- মেট্রিক্সের জন্য লাইব্রেরি ---
+from prometheus_client import Counter as MetricCounter, Gauge, Histogram, generate_latest, start_http_server, CONTENT_TYPE_LATEST
 
 # --- টেলিগ্রাম লাইব্রেরি ---
-from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters, ContextTypes,
-    ConversationHandler, CallbackQueryHandler
+    ConversationHandler, CallbackQueryHandler, BaseUpdateProcessor
 )
-from telegram.error import Forbidden
+from telegram.error import BadRequest, Forbidden, RetryAfter
 
 # --- টেলিগ্রাম ইউজার ক্লায়েন্টের জন্য লাইব্রেরি ---
 from telethon.sync import TelegramClient, events
@@ -25,17 +43,76 @@ from telethon.sync import TelegramClient, events
 # --- কনফিগারেশন (Render-এর Environment Variables থেকে লোড হবে) ---
 # এই মানগুলো আর কোডে লেখা থাকবে না, Render-এর ড্যাশবোর্ড থেকে সেট করতে হবে
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-ADMIN_USER_ID = int(os.environ.get("ADMIN_USER_ID"))
-API_ID = int(os.environ.get("API_ID"))
+# BOT_OFFLINE=1 শুধু লোড-টেস্টের জন্য: লাইভ অ্যাকাউন্ট ছাড়াই লোকাল SQLite-এ হ্যান্ডলারগুলো চালিয়ে মাপা যায়।
+# প্রোডাকশনে এটি সেট না থাকলে ADMIN_USER_ID, API_ID ও DATABASE_URL না দিলে বট চালু হবে না
+BOT_OFFLINE = os.environ.get("BOT_OFFLINE") == "1"
+ADMIN_USER_ID = int(os.environ.get("ADMIN_USER_ID", 0 if BOT_OFFLINE else None))
+API_ID = int(os.environ.get("API_ID", 0 if BOT_OFFLINE else None))
 API_HASH = os.environ.get("API_HASH")
-DATABASE_URL = os.environ.get("DATABASE_URL")
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///bot.db" if BOT_OFFLINE else None)
 SOURCE_CHANNEL = os.environ.get("SOURCE_CHANNEL", "fixforwardotp") # আপনি চাইলে Render-এ এটি পরিবর্তন করতে পারেন
 SESSION_NAME = "my_user_session"
+# "all" (ডিফল্ট): সব এক প্রসেসে। আলাদা প্রসেসে চালাতে: "listener" (Telethon চ্যানেল শোনে),
+# "bot" (ইউজারদের বট), "delivery" (OTP পাঠায়, একাধিক চালানো যায়)
+BOT_ROLE = os.environ.get("BOT_ROLE", "all")
+if BOT_ROLE not in ("all", "bot", "listener", "delivery"):
+    raise ValueError(f"Unknown BOT_ROLE '{BOT_ROLE}'; expected one of: all, bot, listener, delivery")
+
+# WEBHOOK_URL দিলে long polling ও Flask-এর বদলে একটি ASGI সার্ভার PORT-এ Telegram-এর update নেয়
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+# সেট না থাকলে প্রতিবার চালুর সময় নতুন secret তৈরি হয়ে set_webhook-এ পাঠানো হয়, যাতে /telegram রুটে কেউ জাল update পাঠাতে না পারে
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_CONCURRENCY = int(os.environ.get("WEBHOOK_CONCURRENCY", 64))
+# Render automatically sets the PORT environment variable
+PORT = int(os.environ.get('PORT', 8080))
 
 # অন্যান্য সেটিংস
 COOLDOWN_SECONDS = 15
+# "memory" এক প্রসেসের জন্য যথেষ্ট; একাধিক worker চালালে "database" দিন
+COOLDOWN_BACKEND = os.environ.get("COOLDOWN_BACKEND", "memory")
 BALANCE_PER_OTP = 0.60
-BROADCAST_SLEEP_TIME = 0.1
+# ব্যালেন্স পয়সায় (পূর্ণসংখ্যা) রাখা হয়, যাতে float-এর রাউন্ডিং-এ টাকা হারিয়ে না যায়
+BALANCE_PER_OTP_POISHA = round(BALANCE_PER_OTP * 100)
+# Telegram সব চ্যাট মিলিয়ে প্রতি সেকেন্ডে ~30টি মেসেজ পাঠাতে দেয়, তাই একটু কম রাখা হয়েছে
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 25))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 20))
+BROADCAST_MAX_RETRIES = int(os.environ.get("BROADCAST_MAX_RETRIES", 3))
+BROADCAST_PROGRESS_EVERY = int(os.environ.get("BROADCAST_PROGRESS_EVERY", 1000))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+# থ্রেড সংখ্যা pool-এর চেয়ে বেশি হলে থ্রেডগুলো শুধু সংযোগের জন্য অপেক্ষা করবে
+DB_MAX_WORKERS = int(os.environ.get("DB_MAX_WORKERS", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+ASSIGNMENT_INDEX_ENABLED = os.environ.get("ASSIGNMENT_INDEX_ENABLED", "true").lower() == "true" and BOT_ROLE == "all"
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 100000))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 3600))
+OTP_QUEUE_SIZE = int(os.environ.get("OTP_QUEUE_SIZE", 1000))
+OTP_DELIVERY_WORKERS = int(os.environ.get("OTP_DELIVERY_WORKERS", 10))
+OTP_SETTLE_BATCH_SIZE = int(os.environ.get("OTP_SETTLE_BATCH_SIZE", 200))
+OTP_EVENT_BATCH_SIZE = int(os.environ.get("OTP_EVENT_BATCH_SIZE", 100))
+OTP_EVENT_POLL_INTERVAL = float(os.environ.get("OTP_EVENT_POLL_INTERVAL", 0.2))
+# কোনো delivery worker এই সময়ের মধ্যে কাজ শেষ না করলে অন্য worker সেটি আবার নেবে
+OTP_EVENT_VISIBILITY_TIMEOUT = float(os.environ.get("OTP_EVENT_VISIBILITY_TIMEOUT", 60))
+# এতবার দাবি করার পরও পাঠানো না গেলে event বাদ দেওয়া হয়
+OTP_EVENT_MAX_ATTEMPTS = int(os.environ.get("OTP_EVENT_MAX_ATTEMPTS", 5))
+# চালু থাকলে যে মেসেজে টানা PHONE_FAST_PATH_MIN_DIGITS অঙ্ক নেই সেটি regex ছাড়াই বাদ পড়ে
+PHONE_FAST_PATH = os.environ.get("PHONE_FAST_PATH", "false").lower() == "true"
+PHONE_FAST_PATH_MIN_DIGITS = int(os.environ.get("PHONE_FAST_PATH_MIN_DIGITS", 6))
+# এই সময়ের মধ্যে OTP না এলে অ্যাসাইনমেন্ট মুছে ফেলা হয়
+ASSIGNMENT_TTL_SECONDS = int(os.environ.get("ASSIGNMENT_TTL_SECONDS", 3600))
+ASSIGNMENT_SWEEP_INTERVAL = int(os.environ.get("ASSIGNMENT_SWEEP_INTERVAL", 60))
+ASSIGNMENT_SWEEP_BATCH_SIZE = int(os.environ.get("ASSIGNMENT_SWEEP_BATCH_SIZE", 1000))
+RETURN_EXPIRED_NUMBERS = os.environ.get("RETURN_EXPIRED_NUMBERS", "false").lower() == "true"
+# ইন-মেমোরি স্টক কাউন্টার কত সেকেন্ড পরপর COUNT(*) দিয়ে মিলিয়ে নেওয়া হবে
+STOCK_RECONCILE_INTERVAL = int(os.environ.get("STOCK_RECONCILE_INTERVAL", 300))
+BULK_INSERT_BATCH_SIZE = int(os.environ.get("BULK_INSERT_BATCH_SIZE", 5000))
+# এর চেয়ে কম অঙ্কের কিছু নাম্বার হিসেবে স্টকে যোগ হয় না
+MIN_PHONE_DIGITS = int(os.environ.get("MIN_PHONE_DIGITS", 8))
+# E.164 অনুযায়ী একটি নাম্বারে সর্বোচ্চ ১৫টি অঙ্ক
+MAX_PHONE_DIGITS = 15
+NUMBER_CLAIM_MODE = os.environ.get("NUMBER_CLAIM_MODE", "random") # "random" অথবা "fifo"
 USD_TO_BDT_RATE = 110.0
 
 # --- মেনু বাটন এবং Conversation Handler স্টেটস ---
@@ -46,8 +123,35 @@ BTN_WITHDRAW = "💸 Withdraw"
 CHOOSE_METHOD, ENTER_DETAILS, CONFIRM_WITHDRAW = range(3)
 MIN_WITHDRAW = {'recharge': 20, 'rocket': 30, 'binance': 0.25}
 
+# --- কীবোর্ড ও মেসেজ টেমপ্লেট: শুরুতে একবার তৈরি হয়, প্রতি রিকোয়েস্টে শুধু পরিবর্তনশীল অংশ বসে ---
+MAIN_MENU_MARKUP = ReplyKeyboardMarkup(
+    [[KeyboardButton(BTN_GET_NUMBER)], [KeyboardButton(BTN_ACCOUNT), KeyboardButton(BTN_BALANCE)], [KeyboardButton(BTN_WITHDRAW)]],
+    resize_keyboard=True
+)
+REFRESH_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Refresh", callback_data="refresh_button")]])
+WITHDRAW_METHOD_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"📱 Mobile Recharge (min {MIN_WITHDRAW['recharge']} টাকা)", callback_data='withdraw_recharge')],
+    [InlineKeyboardButton(f"🚀 Rocket (min {MIN_WITHDRAW['rocket']} টাকা)", callback_data='withdraw_rocket')],
+    [InlineKeyboardButton(f"🔶 Binance (min {MIN_WITHDRAW['binance']} USD)", callback_data='withdraw_binance')],
+    [InlineKeyboardButton("❌ Cancel", callback_data='withdraw_cancel')]
+])
+
+START_TEMPLATE = "Hi👋, {first_name}!\n\n📞 নাম্বার পেতে Get Number-এ ক্লিক করুন।"
+ADMIN_HELP_TEXT = "আপনি এই বটের অ্যাডমিন।\n`/add`, `/delete`, `/clearall`, `/stats`, `/broadcast`, `/dbstats` কমান্ডগুলো ব্যবহার করুন।"
+NUMBER_ASSIGNED_TEMPLATE = (
+    "📞 আপনার নাম্বার: `{number}`\n\n🔐 এই নাম্বারে OTP এলে এখানেই পাবেন।\n🚫 না এলে অন্য নাম্বার ট্রাই করুন।\n\n"
+    f"💸 প্রতি OTP-তে আপনার ব্যালেন্সে {BALANCE_PER_OTP:.2f} টাকা যোগ হবে।\n💳 {MIN_WITHDRAW['recharge']} টাকা হলেই Withdraw করা যাবে।"
+)
+ACCOUNT_TEMPLATE = "👤 **Account Info**\n\n- **Name:** {full_name}\n- **User ID:** `{user_id}`"
+BALANCE_TEMPLATE = "💰 আপনার বর্তমান ব্যালেন্স: **{balance:.2f}** টাকা।"
+WITHDRAW_MENU_TEMPLATE = "আপনার বর্তমান ব্যালেন্স: **{balance:.2f}** টাকা।\n\nআপনি কোন মাধ্যমে টাকা তুলতে চান? অনুগ্রহ করে নিচের একটি অপশন বেছে নিন:"
+OTP_ALERT_TEMPLATE = "🔑 **OTP Alert!**\n\n**From:** `{raw_number}`\n\n**Message:**\n`{message_text}`"
+
 # --- SQLAlchemy ডাটাবেস সেটআপ ---
-engine = create_engine(DATABASE_URL)
+engine_options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+if not DATABASE_URL.startswith("sqlite"):
+    engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+engine = create_engine(DATABASE_URL, **engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -67,187 +171,610 @@ class User(Base):
     user_id = Column(Integer, primary_key=True, index=True)
 
 class UserBalance(Base):
-    __tablename__ = "user_balances"
-    user_id = Column(Integer, primary_key=True, index=True)
-    balance = Column(Float, default=0.0)
+    # ledger-এর চলমান যোগফল; পুরনো float-ভিত্তিক user_balances টেবিল থেকে একবার কপি করা হয়
+    __tablename__ = "user_wallets"
+    user_id = Column(BigInteger, primary_key=True, index=True) # টেলিগ্রাম user id 2^31 ছাড়িয়ে যায়
+    balance_poisha = Column(BigInteger, nullable=False, default=0)
+
+class BalanceLedger(Base):
+    # শুধু নতুন লাইন যোগ হয়, কখনো পরিবর্তন বা মুছে ফেলা হয় না
+    __tablename__ = "balance_ledger"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(BigInteger, nullable=False, index=True)
+    amount_poisha = Column(BigInteger, nullable=False)
+    reason = Column(String, nullable=False)
+    timestamp = Column(Float, nullable=False)
 
 class ActiveAssignment(Base):
     __tablename__ = "active_assignments"
     number = Column(String, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
-    timestamp = Column(Float, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    timestamp = Column(Float, nullable=False, index=True)
+
+class OtpEvent(Base):
+    # listener থেকে delivery worker-দের কাছে OTP পৌঁছানোর durable queue
+    __tablename__ = "otp_events"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    raw_number = Column(String, nullable=False)
+    number = Column(String, nullable=False)
+    message_text = Column(String, nullable=False)
+    received_at = Column(Float, nullable=False)
+    claimed_until = Column(Float, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
 
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    # create_all আগে থেকে থাকা টেবিলে নতুন index বা কলাম যোগ করে না
+    for index in ActiveAssignment.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    if "attempts" not in {column["name"] for column in inspect(engine).get_columns("otp_events")}:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE otp_events ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"))
+    migrate_legacy_balances()
+
+def migrate_legacy_balances():
+    if not inspect(engine).has_table("user_balances"): return
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM user_wallets LIMIT 1")).first(): return
+        conn.execute(text(
+            "INSERT INTO user_wallets (user_id, balance_poisha) "
+            "SELECT user_id, CAST(ROUND(COALESCE(balance, 0) * 100) AS BIGINT) FROM user_balances"
+        ))
+        conn.execute(text(
+            "INSERT INTO balance_ledger (user_id, amount_poisha, reason, timestamp) "
+            "SELECT user_id, balance_poisha, 'opening_balance', :now FROM user_wallets WHERE balance_poisha <> 0"
+        ), {"now": time.time()})
+
+# --- ডাটাবেসের ব্লকিং কাজগুলো event loop-এর বাইরে আলাদা থ্রেডে চালানো হয় ---
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+async def run_db(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, func, *args)
+
+# --- মেট্রিক্স (/metrics-এ Prometheus ফরম্যাটে দেখা যায়) ---
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time spent in a bot handler", ["handler"])
+HANDLER_ERRORS = MetricCounter("bot_handler_errors_total", "Handler calls that raised", ["handler"])
+DB_QUERY_SECONDS = Histogram("bot_db_query_seconds", "Time spent executing a SQL statement")
+OTP_FORWARDS = MetricCounter("bot_otp_forwards_total", "OTP forward attempts", ["result"])
+OTP_DELIVERY_SECONDS = Histogram("bot_otp_delivery_seconds", "Channel message arrival to OTP delivered to user")
+BROADCAST_MESSAGES = MetricCounter("bot_broadcast_messages_total", "Broadcast messages sent", ["result"])
+BROADCASTS_RUNNING = Gauge("bot_broadcasts_running", "Broadcasts currently in progress")
+Gauge("bot_numbers_in_stock", "Numbers available to hand out").set_function(lambda: get_total_numbers_count())
+Gauge("bot_active_assignments", "Numbers currently assigned to users").set_function(lambda: active_assignment_count["count"])
+Gauge("bot_otp_queue_depth", "OTP deliveries waiting to be sent").set_function(lambda: otp_delivery_queue.qsize())
+Gauge("bot_db_pool_checked_out", "Pooled DB connections in use").set_function(lambda: engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else 0)
+
+@event.listens_for(engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # context প্রতিটি execute-এর নিজস্ব, তাই query ব্যর্থ হলেও শুরুর সময় কোথাও জমে থাকে না
+    context._query_start_time = time.perf_counter()
+
+@event.listens_for(engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_SECONDS.observe(time.perf_counter() - context._query_start_time)
+
+def instrumented(handler):
+    handler_seconds = HANDLER_SECONDS.labels(handler.__name__)
+    handler_errors = HANDLER_ERRORS.labels(handler.__name__)
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            handler_errors.inc()
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started)
+    return wrapper
+
+# --- Helper ফাংশন: নম্বর পরিষ্কার ও মেসেজ থেকে খুঁজে বের করার জন্য ---
+PHONE_NUMBER_PATTERN = re.compile(r'(\+?\d[ \d\-\(\)]{8,}\d)')
+NON_DIGIT_PATTERN = re.compile(r'\D')
+NUMBER_SEPARATOR_PATTERN = re.compile(r'[,;\t]+')
+LONG_DIGIT_RUN_PATTERN = re.compile(r'\d{%d}' % PHONE_FAST_PATH_MIN_DIGITS)
+# PHONE_NUMBER_PATTERN-এর ম্যাচে অঙ্ক ছাড়া শুধু এই চিহ্নগুলোই থাকতে পারে
+PHONE_SEPARATORS = str.maketrans('', '', '+ -()')
 
-# --- Helper ফাংশন: নম্বর পরিষ্কার করার জন্য ---
 def clean_phone_number(raw_number: str) -> str:
-    return re.sub(r'\D', '', raw_number)
+    return NON_DIGIT_PATTERN.sub('', raw_number)
+
+def extract_phone_numbers(message_text: str):
+    # ফেরত দেয় [(raw, cleaned), ...], একই নাম্বার একবারই আসে
+    if PHONE_FAST_PATH and not LONG_DIGIT_RUN_PATTERN.search(message_text):
+        return []
+    found = {}
+    for raw_number in PHONE_NUMBER_PATTERN.findall(message_text):
+        cleaned_number = raw_number.translate(PHONE_SEPARATORS)
+        if cleaned_number not in found:
+            found[cleaned_number] = raw_number
+    return [(raw_number, cleaned_number) for cleaned_number, raw_number in found.items()]
 
 # --- নতুন ডাটাবেস ফাংশন (SQLAlchemy ব্যবহার করে) ---
-def get_db():
+# pool থেকে সংযোগ পেতে কত সময় লাগছে তার হিসাব
+pool_wait_stats = {"sessions": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+pool_wait_lock = Lock()
+
+@contextmanager
+def db_session():
+    # প্রতিটি কাজ একটি transaction: সফল হলে commit, সমস্যা হলে rollback, শেষে সবসময় close
     db = SessionLocal()
     try:
+        started = time.perf_counter()
+        db.connection()
+        waited = time.perf_counter() - started
+        with pool_wait_lock:
+            pool_wait_stats["sessions"] += 1
+            pool_wait_stats["wait_seconds_total"] += waited
+            pool_wait_stats["wait_seconds_max"] = max(pool_wait_stats["wait_seconds_max"], waited)
         yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
+def get_pool_stats():
+    pool = engine.pool
+    with pool_wait_lock:
+        stats = dict(pool_wait_stats)
+    stats["avg_wait_ms"] = stats["wait_seconds_total"] / stats["sessions"] * 1000 if stats["sessions"] else 0.0
+    stats["max_wait_ms"] = stats.pop("wait_seconds_max") * 1000
+    del stats["wait_seconds_total"]
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name): stats[name] = getattr(pool, name)()
+    return stats
+
+def insert_ignoring_duplicates(model):
+    dialect_insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    return dialect_insert(model).on_conflict_do_nothing()
+
+# --- পরিচিত ইউজারদের LRU/TTL cache: ফেরত আসা ইউজারের জন্য ডাটাবেসে যেতে হয় না ---
+known_users = OrderedDict()
+user_cache_stats = {"hits": 0, "misses": 0}
+user_cache_lock = Lock()
+
+def is_known_user(user_id):
+    now = time.monotonic()
+    with user_cache_lock:
+        cached_at = known_users.get(user_id)
+        if cached_at is not None and now - cached_at < USER_CACHE_TTL:
+            known_users.move_to_end(user_id)
+            user_cache_stats["hits"] += 1
+            return True
+        user_cache_stats["misses"] += 1
+        return False
+
+def remember_user(user_id):
+    with user_cache_lock:
+        known_users[user_id] = time.monotonic()
+        known_users.move_to_end(user_id)
+        while len(known_users) > USER_CACHE_SIZE:
+            known_users.popitem(last=False)
+
+def get_user_cache_stats():
+    with user_cache_lock:
+        stats = dict(user_cache_stats, size=len(known_users))
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
 def add_or_update_user(user_id):
-    db = next(get_db())
-    if not db.query(User).filter(User.user_id == user_id).first():
-        db.add(User(user_id=user_id))
-    if not db.query(UserBalance).filter(UserBalance.user_id == user_id).first():
-        db.add(UserBalance(user_id=user_id, balance=0.0))
-    db.commit()
+    with db_session() as db:
+        db.execute(insert_ignoring_duplicates(User).values(user_id=user_id))
+        db.execute(insert_ignoring_duplicates(UserBalance).values(user_id=user_id, balance_poisha=0))
+    remember_user(user_id)
+
+async def ensure_user(user_id):
+    if not is_known_user(user_id):
+        await run_db(add_or_update_user, user_id)
 
 def get_user_balance(user_id):
-    db = next(get_db())
-    user_balance = db.query(UserBalance).filter(UserBalance.user_id == user_id).first()
-    return user_balance.balance if user_balance else 0.0
-
-def update_user_balance(user_id, amount):
-    db = next(get_db())
-    user_balance = db.query(UserBalance).filter(UserBalance.user_id == user_id).first()
-    if user_balance:
-        user_balance.balance += amount
-        db.commit()
+    # টাকায় ফেরত দেয়, শুধু দেখানোর জন্য
+    with db_session() as db:
+        balance_poisha = db.query(UserBalance.balance_poisha).filter(UserBalance.user_id == user_id).scalar()
+    return (balance_poisha or 0) / 100
+
+def credit_user_balances(db, credits, reason):
+    # credits: {user_id: পয়সা}; ledger ও চলমান যোগফল একই transaction-এ
+    now = time.time()
+    db.execute(insert(BalanceLedger), [
+        {"user_id": user_id, "amount_poisha": amount_poisha, "reason": reason, "timestamp": now}
+        for user_id, amount_poisha in credits.items()
+    ])
+    wallets = UserBalance.__table__
+    db.execute(
+        wallets.update().where(wallets.c.user_id == bindparam("wallet_user_id"))
+        .values(balance_poisha=wallets.c.balance_poisha + bindparam("amount_poisha")),
+        [{"wallet_user_id": user_id, "amount_poisha": amount_poisha} for user_id, amount_poisha in credits.items()]
+    )
+
+def debit_user_balance(user_id, amount_poisha, reason):
+    # একটি শর্তযুক্ত UPDATE: ব্যালেন্স যথেষ্ট না থাকলে কিছুই বদলায় না, তাই একসাথে দুটি উইথড্র ব্যালেন্স ঋণাত্মক করতে পারে না
+    with db_session() as db:
+        new_balance = db.execute(
+            update(UserBalance)
+            .where(UserBalance.user_id == user_id, UserBalance.balance_poisha >= amount_poisha)
+            .values(balance_poisha=UserBalance.balance_poisha - amount_poisha)
+            .returning(UserBalance.balance_poisha)
+        ).scalar()
+        if new_balance is None:
+            return False
+        db.add(BalanceLedger(user_id=user_id, amount_poisha=-amount_poisha, reason=reason, timestamp=time.time()))
+    return True
+
+# --- সক্রিয় অ্যাসাইনমেন্টের ইন-মেমোরি ইনডেক্স (নাম্বার -> ইউজার আইডি) ---
+# চ্যানেলের বেশিরভাগ নাম্বার কারো নামে থাকে না, তাই সেগুলোর জন্য ডাটাবেসে যাওয়ার দরকার নেই
+assignment_index = {}
+
+def load_assignment_index():
+    with db_session() as db:
+        rows = db.query(ActiveAssignment.number, ActiveAssignment.user_id).all()
+    assignment_index.clear()
+    assignment_index.update((number, user_id) for number, user_id in rows)
+    return len(assignment_index)
 
 def assign_number_to_user(cleaned_number, user_id):
-    db = next(get_db())
-    db.query(ActiveAssignment).filter(ActiveAssignment.number == cleaned_number).delete()
-    assignment = ActiveAssignment(number=cleaned_number, user_id=user_id, timestamp=time.time())
-    db.add(assignment)
-    db.commit()
+    with db_session() as db:
+        db.query(ActiveAssignment).filter(ActiveAssignment.number == cleaned_number).delete()
+        db.add(ActiveAssignment(number=cleaned_number, user_id=user_id, timestamp=time.time()))
+    assignment_index[cleaned_number] = user_id
 
 def get_assigned_user(cleaned_number):
-    db = next(get_db())
-    assignment = db.query(ActiveAssignment).filter(ActiveAssignment.number == cleaned_number).first()
-    return assignment.user_id if assignment else None
+    with db_session() as db:
+        assignment = db.query(ActiveAssignment).filter(ActiveAssignment.number == cleaned_number).first()
+        return assignment.user_id if assignment else None
 
 def remove_assignment(cleaned_number):
-    db = next(get_db())
-    db.query(ActiveAssignment).filter(ActiveAssignment.number == cleaned_number).delete()
-    db.commit()
+    with db_session() as db:
+        db.query(ActiveAssignment).filter(ActiveAssignment.number == cleaned_number).delete()
+    assignment_index.pop(cleaned_number, None)
+
+def settle_otp_deliveries(deliveries):
+    # একটি ব্যাচের সব ব্যালেন্স যোগ, অ্যাসাইনমেন্ট ও queue-এর event মুছে ফেলা একটি transaction-এ।
+    # শুধু এই transaction-এ সত্যিই মুছে ফেলা অ্যাসাইনমেন্টের জন্য টাকা যোগ হয়, তাই একই অ্যাসাইনমেন্টে দুইবার টাকা যায় না।
+    # queue-এর event-ও একইভাবে: visibility timeout পেরিয়ে অন্য worker আবার দাবি করলে যে আগে মুছতে পারে শুধু সেই টাকা যোগ করে।
+    # ফেরত দেয় কতগুলো ডেলিভারিতে ব্যালেন্স যোগ হয়েছে
+    event_ids = [event_id for _, _, event_id in deliveries if event_id is not None]
+    with db_session() as db:
+        if event_ids:
+            removed_event_ids = set(db.execute(
+                delete(OtpEvent).where(OtpEvent.id.in_(event_ids)).returning(OtpEvent.id)
+            ).scalars().all())
+            deliveries = [delivery for delivery in deliveries if delivery[2] is None or delivery[2] in removed_event_ids]
+        assignments = list({(cleaned_number, user_id) for user_id, cleaned_number, _ in deliveries})
+        if not assignments:
+            return 0
+        removed_user_ids = db.execute(
+            delete(ActiveAssignment)
+            .where(tuple_(ActiveAssignment.number, ActiveAssignment.user_id).in_(assignments))
+            .returning(ActiveAssignment.user_id)
+        ).scalars().all()
+        otp_counts = Counter(removed_user_ids)
+        if otp_counts:
+            credit_user_balances(db, {user_id: BALANCE_PER_OTP_POISHA * otp_count for user_id, otp_count in otp_counts.items()}, "otp")
+    for cleaned_number, _ in assignments:
+        assignment_index.pop(cleaned_number, None)
+    return len(removed_user_ids)
+
+def enqueue_otp_events(numbers, message_text, received_at):
+    # numbers: [(raw, cleaned), ...]; শুধু যেগুলো কারো নামে আছে সেগুলোই queue-তে যায়
+    with db_session() as db:
+        assignees = dict(
+            db.query(ActiveAssignment.number, ActiveAssignment.user_id)
+            .filter(ActiveAssignment.number.in_([cleaned_number for _, cleaned_number in numbers])).all()
+        )
+        otp_events = [
+            {"user_id": assignees[cleaned_number], "raw_number": raw_number, "number": cleaned_number,
+             "message_text": message_text, "received_at": received_at}
+            for raw_number, cleaned_number in numbers if cleaned_number in assignees
+        ]
+        if otp_events:
+            db.execute(insert(OtpEvent), otp_events)
+    return len(otp_events)
+
+def claim_otp_events(limit):
+    # event মুছে না ফেলে কিছু সময়ের জন্য দাবি করা হয়; worker বন্ধ হয়ে গেলে অন্য worker আবার পাবে।
+    # প্রতিটি দাবিতে attempts বাড়ে; OTP_EVENT_MAX_ATTEMPTS বার চেষ্টার পরও যেগুলো রয়ে গেছে সেগুলো মুছে ফেলা হয়
+    now = time.time()
+    lock_clause = " FOR UPDATE SKIP LOCKED" if engine.dialect.name == "postgresql" else ""
+    with db_session() as db:
+        dropped_ids = db.execute(
+            delete(OtpEvent)
+            .where(OtpEvent.attempts >= OTP_EVENT_MAX_ATTEMPTS, OtpEvent.claimed_until < now)
+            .returning(OtpEvent.id)
+        ).scalars().all()
+        if dropped_ids:
+            OTP_FORWARDS.labels("dropped").inc(len(dropped_ids))
+            print(f"Dropped {len(dropped_ids)} OTP events after {OTP_EVENT_MAX_ATTEMPTS} attempts: {dropped_ids}")
+        return db.execute(text(
+            "UPDATE otp_events SET claimed_until = :claimed_until, attempts = attempts + 1 WHERE id IN ("
+            "SELECT id FROM otp_events WHERE claimed_until IS NULL OR claimed_until < :now "
+            f"ORDER BY id LIMIT :limit{lock_clause}"
+            ") RETURNING id, user_id, raw_number, number, message_text, received_at"
+        ), {"claimed_until": now + OTP_EVENT_VISIBILITY_TIMEOUT, "now": now, "limit": limit}).all()
+
+def discard_otp_event(event_id):
+    with db_session() as db:
+        db.query(OtpEvent).filter(OtpEvent.id == event_id).delete()
+
+def postpone_otp_event(event_id, delay_seconds):
+    # flood wait-এর পর যেন আবার দাবি করা যায়, visibility timeout-এর বদলে retry_after পর্যন্ত
+    with db_session() as db:
+        db.query(OtpEvent).filter(OtpEvent.id == event_id).update({"claimed_until": time.time() + delay_seconds}, synchronize_session=False)
+
+last_sweep_stats = {}
+
+def sweep_expired_assignments():
+    # পুরনো অ্যাসাইনমেন্টগুলো ছোট ছোট ব্যাচে মুছে ফেলা হয়, যাতে বড় lock না হয়
+    started = time.monotonic()
+    cutoff = time.time() - ASSIGNMENT_TTL_SECONDS
+    removed_count, returned_count = 0, 0
+    while True:
+        expired = (
+            select(ActiveAssignment.number).where(ActiveAssignment.timestamp < cutoff)
+            .order_by(ActiveAssignment.timestamp).limit(ASSIGNMENT_SWEEP_BATCH_SIZE)
+        )
+        with db_session() as db:
+            numbers = db.execute(
+                delete(ActiveAssignment).where(ActiveAssignment.number.in_(expired)).returning(ActiveAssignment.number)
+            ).scalars().all()
+            if numbers and RETURN_EXPIRED_NUMBERS:
+                returned = db.execute(insert_ignoring_duplicates(Number).values([{"number": num} for num in numbers])).rowcount
+                adjust_stock_counter(returned)
+                returned_count += returned
+        for cleaned_number in numbers:
+            assignment_index.pop(cleaned_number, None)
+        removed_count += len(numbers)
+        if len(numbers) < ASSIGNMENT_SWEEP_BATCH_SIZE:
+            break
+    last_sweep_stats.update(removed=removed_count, returned=returned_count, duration_ms=(time.monotonic() - started) * 1000)
+    return removed_count, returned_count
 
 def add_numbers_to_db(number_list):
-    db = next(get_db())
-    added_count = 0
-    for num in number_list:
-        try:
-            db.add(Number(number=num))
-            db.commit()
-            added_count += 1
-        except IntegrityError:
-            db.rollback()
-    return added_count
+    # ফেরত দেয় (নতুন যোগ হওয়া, আগে থেকেই ছিল এমন, খুব ছোট বা বড় বলে বাদ পড়া) নাম্বারের সংখ্যা
+    cleaned_numbers, rejected_count = [], 0
+    for num in map(clean_phone_number, number_list):
+        if MIN_PHONE_DIGITS <= len(num) <= MAX_PHONE_DIGITS: cleaned_numbers.append(num)
+        elif num: rejected_count += 1
+    if not cleaned_numbers:
+        return 0, 0, rejected_count
+    with db_session() as db:
+        rows = [{"number": num} for num in dict.fromkeys(cleaned_numbers)]
+        result = db.execute(insert_ignoring_duplicates(Number).values(rows))
+    adjust_stock_counter(result.rowcount)
+    return result.rowcount, len(cleaned_numbers) - result.rowcount, rejected_count
+
+def split_number_tokens(line):
+    # কমা/সেমিকোলন/ট্যাব দিয়ে ভাগ; কোনো অংশে ১৫টির বেশি অঙ্ক থাকলে সেটি স্পেস দিয়ে আলাদা করা কয়েকটি নাম্বার,
+    # তাই তখন স্পেসেও ভাগ করা হয় ("+880 1711-000001"-এর মতো স্পেসওয়ালা একটি নাম্বার অক্ষত থাকে)
+    tokens = []
+    for token in NUMBER_SEPARATOR_PATTERN.split(line.strip()):
+        if len(clean_phone_number(token)) > MAX_PHONE_DIGITS: tokens.extend(token.split())
+        else: tokens.append(token)
+    return tokens
+
+def iter_number_batches(lines):
+    # এক লাইনে হাজার হাজার নাম্বার থাকলেও কোনো ব্যাচ BULK_INSERT_BATCH_SIZE ছাড়ায় না
+    # (SQLite-এ একটি INSERT-এ সর্বোচ্চ 32766টি প্যারামিটার)
+    batch = []
+    for line in lines:
+        batch.extend(split_number_tokens(line))
+        while len(batch) >= BULK_INSERT_BATCH_SIZE:
+            yield batch[:BULK_INSERT_BATCH_SIZE]
+            batch = batch[BULK_INSERT_BATCH_SIZE:]
+    if batch:
+        yield batch
+
+def import_numbers_file(path):
+    # বড় ফাইল পুরোটা মেমোরিতে না তুলে লাইন ধরে পড়া হয়, প্রতিটি ব্যাচ একটি INSERT
+    added_total, duplicate_total, rejected_total = 0, 0, 0
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for batch in iter_number_batches(f):
+            added_count, duplicate_count, rejected_count = add_numbers_to_db(batch)
+            added_total += added_count
+            duplicate_total += duplicate_count
+            rejected_total += rejected_count
+    return added_total, duplicate_total, rejected_total
 
 def delete_number_from_db(number_to_delete):
-    db = next(get_db())
-    deleted_count = db.query(Number).filter(Number.number == number_to_delete).delete()
-    db.commit()
+    with db_session() as db:
+        deleted_count = db.query(Number).filter(Number.number.in_({number_to_delete, clean_phone_number(number_to_delete)})).delete()
+    adjust_stock_counter(-deleted_count)
     return deleted_count > 0
 
 def clear_all_numbers_from_db():
-    db = next(get_db())
-    count = db.query(Number).count()
-    db.query(Number).delete()
-    db.commit()
+    with db_session() as db:
+        count = db.query(Number).delete()
+    with stock_counter_lock:
+        stock_counter["count"] = 0
+    return count
+
+# --- স্টক কাউন্টার: প্রতিবার COUNT(*) না চালিয়ে যোগ/বিয়োগের সাথে সাথে আপডেট হয় ---
+stock_counter = {"count": 0}
+stock_counter_lock = Lock()
+
+def adjust_stock_counter(delta):
+    with stock_counter_lock:
+        stock_counter["count"] = max(0, stock_counter["count"] + delta)
+
+def reconcile_stock_counter():
+    with db_session() as db:
+        count = db.query(Number).count()
+    with stock_counter_lock:
+        stock_counter["count"] = count
     return count
 
 def get_total_numbers_count():
-    db = next(get_db())
-    return db.query(Number).count()
+    return stock_counter["count"]
+
+# ইনডেক্স শুধু "all" রোলে থাকে এবং পাঠানোর সময় নাম্বার সরিয়ে নেয়, তাই গেজের জন্য টেবিল থেকেই গোনা হয়
+active_assignment_count = {"count": 0}
+
+def refresh_active_assignment_count():
+    with db_session() as db:
+        active_assignment_count["count"] = db.query(ActiveAssignment).count()
+    return active_assignment_count["count"]
+
+def claim_number(db):
+    # একটি মাত্র DELETE ... RETURNING দিয়ে নাম্বার নেওয়া ও মুছে ফেলা হয়, তাই দুইজন একই নাম্বার পাবে না।
+    # primary key index ব্যবহার করায় স্টক যত বড়ই হোক খরচ প্রায় একই থাকে।
+    lock_clause = " FOR UPDATE SKIP LOCKED" if engine.dialect.name == "postgresql" else ""
+    claim_sql = text(
+        "DELETE FROM numbers WHERE id = ("
+        f"SELECT id FROM numbers WHERE id >= :start_id ORDER BY id LIMIT 1{lock_clause}"
+        ") RETURNING number"
+    )
+    start_ids = [0]
+    if NUMBER_CLAIM_MODE == "random":
+        min_id, max_id = db.execute(text("SELECT (SELECT MIN(id) FROM numbers), (SELECT MAX(id) FROM numbers)")).one()
+        if min_id is None: return None
+        start_ids = [random.randint(min_id, max_id), 0]
+    for start_id in start_ids:
+        claimed = db.execute(claim_sql, {"start_id": start_id}).scalar()
+        if claimed: return claimed
+    return None
+
+def reserve_number_for_user(user_id):
+    with db_session() as db:
+        number_to_give = claim_number(db)
+    if number_to_give:
+        adjust_stock_counter(-1)
+        assign_number_to_user(clean_phone_number(number_to_give), user_id)
+    return number_to_give
 
 def get_all_user_ids():
-    db = next(get_db())
-    return [item.user_id for item in db.query(User.user_id).all()]
+    with db_session() as db:
+        return [item.user_id for item in db.query(User.user_id).all()]
+
+# --- কুলডাউন লিমিটার: অপেক্ষমাণ ইউজারকে ফেরানোর জন্য ডাটাবেসে যেতে হয় না ---
+class DatabaseCooldownBackend:
+    # একাধিক worker একই user_cooldown টেবিল ভাগ করে; তাই এখানে wall clock ব্যবহার করা হয়
+    def try_acquire(self, user_id, seconds):
+        now = time.time()
+        dialect_insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+        stmt = dialect_insert(UserCooldown).values(user_id=user_id, last_request_time=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserCooldown.user_id],
+            set_={"last_request_time": now},
+            where=UserCooldown.last_request_time <= now - seconds,
+        ).returning(UserCooldown.user_id)
+        with db_session() as db:
+            if db.execute(stmt).first():
+                return 0
+            last_request_time = db.query(UserCooldown.last_request_time).filter(UserCooldown.user_id == user_id).scalar()
+        return max(0, seconds - (now - last_request_time))
+
+    def release(self, user_id):
+        with db_session() as db:
+            db.query(UserCooldown).filter(UserCooldown.user_id == user_id).delete()
+
+class CooldownLimiter:
+    def __init__(self, seconds, shared_backend=None):
+        self.seconds = seconds
+        self.shared_backend = shared_backend
+        self.expires_at = {}
+        self.last_eviction = time.monotonic()
+
+    def evict_expired(self, now):
+        if now - self.last_eviction < self.seconds: return
+        self.expires_at = {user_id: expires for user_id, expires in self.expires_at.items() if expires > now}
+        self.last_eviction = now
+
+    async def try_acquire(self, user_id):
+        # ফেরত দেয় আর কত সেকেন্ড অপেক্ষা করতে হবে; 0 মানে অনুমতি পাওয়া গেছে
+        now = time.monotonic()
+        self.evict_expired(now)
+        expires = self.expires_at.get(user_id)
+        if expires and expires > now:
+            return expires - now
+        if self.shared_backend:
+            remaining = await run_db(self.shared_backend.try_acquire, user_id, self.seconds)
+            if remaining:
+                self.expires_at[user_id] = now + remaining
+                return remaining
+        self.expires_at[user_id] = now + self.seconds
+        return 0
+
+    async def release(self, user_id):
+        self.expires_at.pop(user_id, None)
+        if self.shared_backend:
+            await run_db(self.shared_backend.release, user_id)
+
+cooldown_limiter = CooldownLimiter(COOLDOWN_SECONDS, DatabaseCooldownBackend() if COOLDOWN_BACKEND == "database" else None)
 
 # --- টেলিগ্রাম বট হ্যান্ডলার (সংশোধিত ও ত্রুটিমুক্ত) ---
 
+@instrumented
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    add_or_update_user(user.id)
-    keyboard = [[KeyboardButton(BTN_GET_NUMBER)], [KeyboardButton(BTN_ACCOUNT), KeyboardButton(BTN_BALANCE)], [KeyboardButton(BTN_WITHDRAW)]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    await update.message.reply_text(f"Hi👋, {user.first_name}!\n\n📞 নাম্বার পেতে Get Number-এ ক্লিক করুন।", reply_markup=reply_markup)
+    await ensure_user(user.id)
+    await update.message.reply_text(START_TEMPLATE.format(first_name=user.first_name), reply_markup=MAIN_MENU_MARKUP)
     if user.id == ADMIN_USER_ID:
-        await update.message.reply_text("আপনি এই বটের অ্যাডমিন।\n`/add`, `/delete`, `/clearall`, `/stats`, `/broadcast` কমান্ডগুলো ব্যবহার করুন।")
+        await update.message.reply_text(ADMIN_HELP_TEXT)
 
+@instrumented
 async def handle_get_number_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    add_or_update_user(user_id)
-    db = next(get_db())
-
-    cooldown = db.query(UserCooldown).filter(UserCooldown.user_id == user_id).first()
-    current_time = time.time()
-    if cooldown and (current_time - cooldown.last_request_time < COOLDOWN_SECONDS):
-        await update.message.reply_text(f"অনুগ্রহ করে {int(COOLDOWN_SECONDS - (current_time - cooldown.last_request_time))} সেকেন্ড অপেক্ষা করুন।")
+    await ensure_user(user_id)
+    wait_seconds = await cooldown_limiter.try_acquire(user_id)
+    if wait_seconds:
+        await update.message.reply_text(f"অনুগ্রহ করে {int(wait_seconds)} সেকেন্ড অপেক্ষা করুন।")
         return
 
-    total_numbers = get_total_numbers_count()
-    number_row = None
-    if total_numbers > 0:
-        random_offset = random.randint(0, total_numbers - 1)
-        number_row = db.query(Number).offset(random_offset).first()
-
-    if number_row:
-        number_to_give = number_row.number
-        db.query(Number).filter(Number.id == number_row.id).delete()
-        
-        if cooldown:
-            cooldown.last_request_time = current_time
-        else:
-            db.add(UserCooldown(user_id=user_id, last_request_time=current_time))
-        db.commit()
-
-        cleaned_number = clean_phone_number(number_to_give)
-        assign_number_to_user(cleaned_number, user_id)
-        
-        keyboard = [[InlineKeyboardButton("🔄 Refresh", callback_data="refresh_button")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
+    try:
+        number_to_give = await run_db(reserve_number_for_user, user_id)
+    except Exception:
+        # ডাটাবেস error-এ ইউজার নাম্বার পায়নি, তাই কুলডাউনে আটকে রাখা হয় না
+        await cooldown_limiter.release(user_id)
+        raise
+    if number_to_give:
         await update.message.reply_text(
-            f"📞 আপনার নাম্বার: `{number_to_give}`\n\n🔐 এই নাম্বারে OTP এলে এখানেই পাবেন।\n🚫 না এলে অন্য নাম্বার ট্রাই করুন।\n\n💸 প্রতি OTP-তে আপনার ব্যালেন্সে 0.60 টাকা যোগ হবে।\n💳 20 টাকা হলেই Withdraw করা যাবে।",
+            NUMBER_ASSIGNED_TEMPLATE.format(number=number_to_give),
             parse_mode='Markdown',
-            reply_markup=reply_markup
+            reply_markup=REFRESH_MARKUP
         )
     else:
+        # নাম্বার না পেলে কুলডাউন গণনা হয় না
+        await cooldown_limiter.release(user_id)
         await update.message.reply_text("দুঃখিত, এই মুহূর্তে কোনো নাম্বার অবশিষ্ট নেই।")
-        await context.bot.send_message(chat_id=ADMIN_USER_ID, text="🚨 সতর্কবার্তা: বট-এর সকল নাম্বার শেষ হয়ে গেছে! অনুগ্রহ করে দ্রুত নতুন নাম্বার যোগ করুন।")
+        await context.bot.send_message(chat_id=ADMIN_USER_ID, text="🚨 সতর্কবার্তা: বট-এর সকল নাম্বার শেষ হয়ে গেছে! অনুগ্রহ করে দ্রুত নতুন নাম্বার যোগ করুন।")
 
+@instrumented
 async def refresh_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer(text="🔄 Refreshing...", show_alert=False)
 
+@instrumented
 async def handle_account_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    add_or_update_user(user.id)
-    await update.message.reply_text(f"👤 **Account Info**\n\n- **Name:** {user.full_name}\n- **User ID:** `{user.id}`", parse_mode='Markdown')
+    await ensure_user(user.id)
+    await update.message.reply_text(ACCOUNT_TEMPLATE.format(full_name=user.full_name, user_id=user.id), parse_mode='Markdown')
 
+@instrumented
 async def handle_balance_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    add_or_update_user(user_id)
-    balance = get_user_balance(user_id)
-    await update.message.reply_text(f"💰 আপনার বর্তমান ব্যালেন্স: **{balance:.2f}** টাকা।", parse_mode='Markdown')
+    await ensure_user(user_id)
+    balance = await run_db(get_user_balance, user_id)
+    await update.message.reply_text(BALANCE_TEMPLATE.format(balance=balance), parse_mode='Markdown')
 
+@instrumented
 async def handle_withdraw_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    add_or_update_user(user_id)
-    balance = get_user_balance(user_id)
-    keyboard = [
-        [InlineKeyboardButton(f"📱 Mobile Recharge (min {MIN_WITHDRAW['recharge']} টাকা)", callback_data='withdraw_recharge')],
-        [InlineKeyboardButton(f"🚀 Rocket (min {MIN_WITHDRAW['rocket']} টাকা)", callback_data='withdraw_rocket')],
-        [InlineKeyboardButton(f"🔶 Binance (min {MIN_WITHDRAW['binance']} USD)", callback_data='withdraw_binance')],
-        [InlineKeyboardButton("❌ Cancel", callback_data='withdraw_cancel')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await ensure_user(user_id)
+    balance = await run_db(get_user_balance, user_id)
     await update.message.reply_text(
-        f"আপনার বর্তমান ব্যালেন্স: **{balance:.2f}** টাকা।\n\nআপনি কোন মাধ্যমে টাকা তুলতে চান? অনুগ্রহ করে নিচের একটি অপশন বেছে নিন:",
-        reply_markup=reply_markup,
+        WITHDRAW_MENU_TEMPLATE.format(balance=balance),
+        reply_markup=WITHDRAW_METHOD_MARKUP,
         parse_mode='Markdown'
     )
     return CHOOSE_METHOD
 
+@instrumented
 async def choose_withdraw_method(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -259,7 +786,7 @@ async def choose_withdraw_method(update: Update, context: ContextTypes.DEFAULT_T
 
     context.user_data['withdraw_method'] = choice
     min_amount_bdt = MIN_WITHDRAW[choice] if choice != 'binance' else MIN_WITHDRAW[choice] * USD_TO_BDT_RATE
-    user_balance = get_user_balance(query.from_user.id)
+    user_balance = await run_db(get_user_balance, query.from_user.id)
 
     if user_balance < min_amount_bdt:
         await query.edit_message_text(f"❌ দুঃখিত, আপনার ব্যালেন্স পর্যাপ্ত নয়। এই মাধ্যমে টাকা তুলতে সর্বনিম্ন ৳{min_amount_bdt:.2f} প্রয়োজন।")
@@ -273,6 +800,7 @@ async def choose_withdraw_method(update: Update, context: ContextTypes.DEFAULT_T
     await query.edit_message_text(text=prompt_text)
     return ENTER_DETAILS
 
+@instrumented
 async def enter_withdraw_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['withdraw_details'] = update.message.text
     method = context.user_data['withdraw_method']
@@ -283,6 +811,7 @@ async def enter_withdraw_details(update: Update, context: ContextTypes.DEFAULT_T
     await update.message.reply_text(prompt_text)
     return CONFIRM_WITHDRAW
 
+@instrumented
 async def confirm_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try: amount = float(update.message.text)
     except ValueError:
@@ -292,8 +821,7 @@ async def confirm_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     method = context.user_data['withdraw_method']
     details = context.user_data['withdraw_details']
-    balance = get_user_balance(user_id)
-    
+
     min_amount = MIN_WITHDRAW[method]
     amount_in_bdt = amount if method != 'binance' else amount * USD_TO_BDT_RATE
 
@@ -301,11 +829,10 @@ async def confirm_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"দুঃখিত, সর্বনিম্ন উইথড্র পরিমাণ হলো {min_amount} {'USD' if method == 'binance' else 'BDT'}")
         return CONFIRM_WITHDRAW
 
-    if balance < amount_in_bdt:
+    if not await run_db(debit_user_balance, user_id, round(amount_in_bdt * 100), f"withdraw_{method}"):
         await update.message.reply_text("দুঃখিত, আপনার অ্যাকাউন্টে পর্যাপ্ত ব্যালেন্স নেই।")
         return ConversationHandler.END
-    
-    update_user_balance(user_id, -amount_in_bdt)
+
     admin_message = (
         f"🔔 নতুন উইথড্র অনুরোধ!\n\n"
         f"👤 ব্যবহারকারী: {update.effective_user.full_name} (ID: `{user_id}`)\n"
@@ -317,60 +844,307 @@ async def confirm_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("✅ আপনার উইথড্র অনুরোধ সফলভাবে পাঠানো হয়েছে। অ্যাডমিন এটি পর্যালোচনা করে দ্রুত ব্যবস্থা নিবেন।")
     return ConversationHandler.END
 
+@instrumented
 async def cancel_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("উইথড্র প্রক্রিয়া বাতিল করা হয়েছে।")
     return ConversationHandler.END
 
-# --- অ্যাডমিন কমান্ড ---
-async def broadcast_to_all_users(context: ContextTypes.DEFAULT_TYPE, message_text: str):
-    user_ids = get_all_user_ids()
-    for user_id in user_ids:
+# --- ব্রডকাস্ট ইঞ্জিন (রেট লিমিট মেনে একসাথে অনেক মেসেজ পাঠানো) ---
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        # flood wait এলে সব পাঠানো কাজ একসাথে থেমে যাবে
+        self.tokens = 0
+        self.updated = time.monotonic() + seconds
+
+# প্রতিটি চ্যাটে একটি করে মেসেজ যায়, তাই per-chat সীমা নিয়ে আলাদা চিন্তা করতে হয় না
+broadcast_bucket = TokenBucket(BROADCAST_RATE)
+
+def retry_after_seconds(error):
+    # PTB-র নতুন সংস্করণে retry_after একটি timedelta
+    return error.retry_after.total_seconds() if hasattr(error.retry_after, "total_seconds") else error.retry_after
+
+async def send_broadcast_message(bot, user_id, message_text):
+    for _ in range(BROADCAST_MAX_RETRIES + 1):
+        await broadcast_bucket.acquire()
         try:
-            await context.bot.send_message(chat_id=user_id, text=message_text)
-            await asyncio.sleep(BROADCAST_SLEEP_TIME)
-        except Forbidden: print(f"ব্যর্থ: ব্যবহারকারী {user_id} বটকে ব্লক করেছেন।")
-        except Exception as e: print(f"ব্রডকাস্ট করতে সমস্যা: {e}")
+            await bot.send_message(chat_id=user_id, text=message_text)
+            return True
+        except RetryAfter as e:
+            retry_after = retry_after_seconds(e)
+            print(f"Flood wait: {retry_after} সেকেন্ড বিরতি।")
+            broadcast_bucket.pause(retry_after)
+        except Forbidden:
+            return False
+        except Exception as e:
+            print(f"ব্রডকাস্ট করতে সমস্যা ({user_id}): {e}")
+            return False
+    return False
+
+async def broadcast_to_all_users(bot, message_text: str, report_chat_id=None):
+    user_ids = await run_db(get_all_user_ids)
+    counts = {"success": 0, "fail": 0}
+    progress_message = None
+    if report_chat_id:
+        progress_message = await bot.send_message(chat_id=report_chat_id, text=f"{len(user_ids)} জন ব্যবহারকারীকে মেসেজ পাঠানো শুরু হচ্ছে...")
+
+    pending_ids = iter(user_ids)
+    async def broadcast_worker():
+        for user_id in pending_ids:
+            result = "success" if await send_broadcast_message(bot, user_id, message_text) else "fail"
+            counts[result] += 1
+            BROADCAST_MESSAGES.labels(result).inc()
+            done = counts["success"] + counts["fail"]
+            if progress_message and done % BROADCAST_PROGRESS_EVERY == 0:
+                try: await progress_message.edit_text(f"ব্রডকাস্ট চলছে: {done}/{len(user_ids)}")
+                except Exception as e: print(f"Progress আপডেট করতে সমস্যা: {e}")
+
+    started = time.monotonic()
+    BROADCASTS_RUNNING.inc()
+    try:
+        await asyncio.gather(*(broadcast_worker() for _ in range(BROADCAST_CONCURRENCY)))
+    finally:
+        BROADCASTS_RUNNING.dec()
+    elapsed = time.monotonic() - started
+    print(f"Broadcast finished: {counts['success']} sent, {counts['fail']} failed in {elapsed:.1f}s.")
+    if progress_message:
+        await bot.send_message(chat_id=report_chat_id, text=f"ব্রডকাস্ট সম্পন্ন!\nসফল: {counts['success']} জন। ব্যর্থ: {counts['fail']} জন।")
+
+def start_broadcast(context: ContextTypes.DEFAULT_TYPE, message_text: str, report_chat_id=None):
+    # অ্যাডমিন কমান্ড যেন সাথে সাথে উত্তর পায়, তাই ব্রডকাস্ট আলাদা টাস্কে চলে
+    context.application.create_task(broadcast_to_all_users(context.bot, message_text, report_chat_id))
 
+# --- অ্যাডমিন কমান্ড ---
+@instrumented
 async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_USER_ID: return
-    if not context.args: await update.message.reply_text("ব্যবহার: /add <num1> <num2> ..."); return
-    added_count = add_numbers_to_db(context.args)
-    await update.message.reply_text(f"সফলভাবে {added_count} টি নতুন নাম্বার যোগ করা হয়েছে।")
-    if added_count > 0:
-        total_numbers = get_total_numbers_count()
-        await broadcast_to_all_users(context, f"🎉 সুসংবাদ! আমাদের স্টকে নতুন নাম্বার যোগ করা হয়েছে।\n\n현재 মোট নাম্বার সংখ্যা: {total_numbers}টি।")
+    if not context.args: await update.message.reply_text("ব্যবহার: /add <num1> <num2> ...\nঅথবা নাম্বারের .txt/.csv ফাইল পাঠান।"); return
+    added_count, duplicate_count, rejected_count = await run_db(add_numbers_to_db, context.args)
+    await update.message.reply_text(
+        f"সফলভাবে {added_count} টি নতুন নাম্বার যোগ করা হয়েছে। ডুপ্লিকেট: {duplicate_count} টি।\n"
+        f"অবৈধ ({MIN_PHONE_DIGITS}-{MAX_PHONE_DIGITS} অঙ্কের নয়): {rejected_count} টি।"
+    )
+    if added_count > 0: await announce_new_numbers(context)
+
+@instrumented
+async def add_file_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_USER_ID: return
+    document = update.message.document
+    if not document.file_name or not document.file_name.lower().endswith(('.txt', '.csv')):
+        await update.message.reply_text("শুধু .txt অথবা .csv ফাইল গ্রহণ করা হয়।"); return
+
+    await update.message.reply_text("ফাইল থেকে নাম্বার যোগ করা হচ্ছে...")
+    telegram_file = await document.get_file()
+    with tempfile.NamedTemporaryFile(suffix=".txt") as tmp:
+        await telegram_file.download_to_drive(tmp.name)
+        started = time.monotonic()
+        added_count, duplicate_count, rejected_count = await run_db(import_numbers_file, tmp.name)
+        elapsed = time.monotonic() - started
+    rows_per_second = (added_count + duplicate_count + rejected_count) / elapsed if elapsed else 0
+    await update.message.reply_text(
+        f"সফলভাবে {added_count} টি নতুন নাম্বার যোগ করা হয়েছে। ডুপ্লিকেট: {duplicate_count} টি।\n"
+        f"অবৈধ ({MIN_PHONE_DIGITS}-{MAX_PHONE_DIGITS} অঙ্কের নয়): {rejected_count} টি।\n"
+        f"⏱ {elapsed:.1f} সেকেন্ড ({rows_per_second:.0f} rows/s)"
+    )
+    if added_count > 0: await announce_new_numbers(context)
 
+async def announce_new_numbers(context: ContextTypes.DEFAULT_TYPE):
+    total_numbers = get_total_numbers_count()
+    start_broadcast(context, f"🎉 সুসংবাদ! আমাদের স্টকে নতুন নাম্বার যোগ করা হয়েছে।\n\n현재 মোট নাম্বার সংখ্যা: {total_numbers}টি।")
+
+@instrumented
 async def clearall_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_USER_ID: return
-    deleted_count = clear_all_numbers_from_db()
+    deleted_count = await run_db(clear_all_numbers_from_db)
     await update.message.reply_text(f"সফলভাবে {deleted_count} টি নাম্বার তালিকা থেকে মুছে ফেলা হয়েছে।")
-    if deleted_count > 0: await broadcast_to_all_users(context, "দুঃখিত, আমাদের স্টকের সকল নাম্বার শেষ হয়ে গেছে। খুব শীঘ্রই আবার নাম্বার যোগ করা হবে।")
+    if deleted_count > 0: start_broadcast(context, "দুঃখিত, আমাদের স্টকের সকল নাম্বার শেষ হয়ে গেছে। খুব শীঘ্রই আবার নাম্বার যোগ করা হবে।")
 
+@instrumented
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_USER_ID: return
     count = get_total_numbers_count()
     await update.message.reply_text(f"এখনও {count} টি নাম্বার অবশিষ্ট আছে।")
-    await broadcast_to_all_users(context, f"📊 নাম্বার আপডেট!\n\n📦 আমাদের স্টকে বর্তমানে মোট {count} টি নাম্বার উপলব্ধ আছে।")
+    start_broadcast(context, f"📊 নাম্বার আপডেট!\n\n📦 আমাদের স্টকে বর্তমানে মোট {count} টি নাম্বার উপলব্ধ আছে।")
+
+def format_stats(title, stats):
+    lines = [f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}" for name, value in stats.items()]
+    return title + "\n" + "\n".join(lines)
 
+@instrumented
+async def dbstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_USER_ID: return
+    await update.message.reply_text(
+        format_stats("🗄 ডাটাবেস pool:", get_pool_stats()) + "\n\n" +
+        format_stats("👥 ইউজার cache:", get_user_cache_stats()) + "\n\n" +
+        format_stats("📨 OTP pipeline:", get_otp_pipeline_stats()) + "\n\n" +
+        format_stats("🧹 শেষ sweep:", last_sweep_stats)
+    )
+
+@instrumented
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_USER_ID: return
     if not context.args or len(context.args) != 1: await update.message.reply_text("ব্যবহার: /delete <number>"); return
-    if delete_number_from_db(context.args[0]): await update.message.reply_text(f"নাম্বার '{context.args[0]}' মুছে ফেলা হয়েছে।")
+    if await run_db(delete_number_from_db, context.args[0]): await update.message.reply_text(f"নাম্বার '{context.args[0]}' মুছে ফেলা হয়েছে।")
     else: await update.message.reply_text(f"নাম্বার '{context.args[0]}' পাওয়া যায়নি।")
 
+@instrumented
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_USER_ID: return
     if not context.args: await update.message.reply_text("ব্যবহার: /broadcast <আপনার মেসেজ>"); return
     broadcast_message = " ".join(context.args)
-    user_ids = get_all_user_ids()
-    await update.message.reply_text(f"{len(user_ids)} জন ব্যবহারকারীকে মেসেজ পাঠানো শুরু হচ্ছে..."); success_count = 0; fail_count = 0
-    for user_id in user_ids:
+    start_broadcast(context, broadcast_message, report_chat_id=update.effective_chat.id)
+
+# --- OTP ফরওয়ার্ডিং পাইপলাইন ---
+# চ্যানেলের মেসেজ থেকে ডেলিভারি queue-তে যায়, কয়েকটি worker একসাথে পাঠায়,
+# আর সফল ডেলিভারিগুলোর ব্যালেন্স ও অ্যাসাইনমেন্ট ব্যাচ আকারে ডাটাবেসে লেখা হয়
+otp_delivery_queue = asyncio.Queue(maxsize=OTP_QUEUE_SIZE)
+otp_settle_queue = asyncio.Queue()
+otp_latencies = deque(maxlen=1000)
+otp_pipeline_tasks = []
+# queue-তে ঢোকা থেকে settle হওয়া পর্যন্ত নাম্বারগুলো; একই নাম্বারের দ্বিতীয় OTP তখন আর queue-তে যায় না
+otp_numbers_in_flight = set()
+
+@instrumented
+async def forwarder_handler(event):
+    # আলাদা প্রসেস হলেও latency মাপা যায়, তাই wall clock
+    received_at = time.time()
+    message_text = event.message.text
+    if not message_text: return
+
+    numbers_in_message = extract_phone_numbers(message_text)
+    if BOT_ROLE == "listener":
+        if numbers_in_message:
+            await run_db(enqueue_otp_events, numbers_in_message, message_text, received_at)
+        return
+
+    for raw_number, cleaned_number in numbers_in_message:
+        if cleaned_number in otp_numbers_in_flight: continue
+        if ASSIGNMENT_INDEX_ENABLED:
+            assigned_user_id = assignment_index.pop(cleaned_number, None)
+        else:
+            assigned_user_id = await run_db(get_assigned_user, cleaned_number)
+
+        if assigned_user_id and cleaned_number not in otp_numbers_in_flight:
+            otp_numbers_in_flight.add(cleaned_number)
+            await otp_delivery_queue.put((assigned_user_id, raw_number, cleaned_number, message_text, received_at, None))
+
+async def otp_event_consumer():
+    # delivery প্রসেসে ডাটাবেসের queue থেকে event নিয়ে ইন-প্রসেস পাইপলাইনে দেওয়া হয়
+    while True:
+        try:
+            otp_events = await run_db(claim_otp_events, OTP_EVENT_BATCH_SIZE)
+        except Exception as e:
+            print(f"Failed to claim OTP events: {e}")
+            otp_events = []
+        for event_id, user_id, raw_number, cleaned_number, message_text, received_at in otp_events:
+            await otp_delivery_queue.put((user_id, raw_number, cleaned_number, message_text, received_at, event_id))
+        if len(otp_events) < OTP_EVENT_BATCH_SIZE:
+            await asyncio.sleep(OTP_EVENT_POLL_INTERVAL)
+
+async def otp_delivery_worker(bot):
+    while True:
+        assigned_user_id, raw_number, cleaned_number, message_text, received_at, event_id = await otp_delivery_queue.get()
+        try:
+            await bot.send_message(
+                chat_id=assigned_user_id,
+                text=OTP_ALERT_TEMPLATE.format(raw_number=raw_number, message_text=message_text),
+                parse_mode='Markdown'
+            )
+            delivery_seconds = time.time() - received_at
+            otp_latencies.append(delivery_seconds)
+            OTP_DELIVERY_SECONDS.observe(delivery_seconds)
+            OTP_FORWARDS.labels("success").inc()
+            otp_settle_queue.put_nowait((assigned_user_id, cleaned_number, event_id))
+            print(f"OTP successfully forwarded to user {assigned_user_id}.")
+        except Exception as e:
+            OTP_FORWARDS.labels("failure").inc()
+            print(f"Failed to send message to user {assigned_user_id}: {e}")
+            # পাঠানো না গেলে অ্যাসাইনমেন্ট থেকে যায়, পরের OTP আবার চেষ্টা করবে
+            otp_numbers_in_flight.discard(cleaned_number)
+            if ASSIGNMENT_INDEX_ENABLED and event_id is None:
+                assignment_index.setdefault(cleaned_number, assigned_user_id)
+            # ইউজার বট ব্লক করলে বা মেসেজ বাতিল হলে আর চেষ্টা করে লাভ নেই; flood wait-এ retry_after পরে,
+            # অন্য error-এ visibility timeout শেষে কোনো worker আবার পাঠাবে (সর্বোচ্চ OTP_EVENT_MAX_ATTEMPTS বার)
+            if event_id is not None and isinstance(e, (Forbidden, BadRequest)):
+                try: await run_db(discard_otp_event, event_id)
+                except Exception as e: print(f"Failed to discard OTP event {event_id}: {e}")
+            elif event_id is not None and isinstance(e, RetryAfter):
+                try: await run_db(postpone_otp_event, event_id, retry_after_seconds(e))
+                except Exception as e: print(f"Failed to postpone OTP event {event_id}: {e}")
+        finally:
+            otp_delivery_queue.task_done()
+
+async def otp_settle_worker():
+    while True:
+        batch = [await otp_settle_queue.get()]
+        while len(batch) < OTP_SETTLE_BATCH_SIZE and not otp_settle_queue.empty():
+            batch.append(otp_settle_queue.get_nowait())
+        # OTP আগেই পাঠানো হয়ে গেছে, তাই ব্যাচ বাদ না দিয়ে সফল না হওয়া পর্যন্ত আবার চেষ্টা করা হয়
+        retry_delay = 1
+        while True:
+            try:
+                await run_db(settle_otp_deliveries, batch)
+                break
+            except Exception as e:
+                print(f"Failed to settle {len(batch)} OTP deliveries, retrying in {retry_delay}s: {e}")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+        for _, cleaned_number, _ in batch:
+            otp_numbers_in_flight.discard(cleaned_number)
+
+def start_otp_pipeline(bot):
+    for _ in range(OTP_DELIVERY_WORKERS):
+        otp_pipeline_tasks.append(asyncio.create_task(otp_delivery_worker(bot)))
+    otp_pipeline_tasks.append(asyncio.create_task(otp_settle_worker()))
+
+def get_otp_pipeline_stats():
+    latencies = sorted(otp_latencies)
+    stats = {"delivery_queue": otp_delivery_queue.qsize(), "settle_queue": otp_settle_queue.qsize(), "delivered": len(latencies)}
+    if latencies:
+        for name, fraction in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            stats[name] = latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+        stats["max_ms"] = latencies[-1] * 1000
+    return stats
+
+# --- স্টক কাউন্টার মিলিয়ে নেওয়া ---
+async def stock_reconciler():
+    while True:
+        await asyncio.sleep(STOCK_RECONCILE_INTERVAL)
         try:
-            await context.bot.send_message(chat_id=user_id, text=broadcast_message); success_count += 1
-        except Forbidden: fail_count += 1
-        except Exception as e: print(f"Error sending to {user_id}: {e}"); fail_count += 1
-        await asyncio.sleep(BROADCAST_SLEEP_TIME)
-    await update.message.reply_text(f"ব্রডকাস্ট সম্পন্ন!\nসফল: {success_count} জন। ব্যর্থ: {fail_count} জন।")
+            drift = get_total_numbers_count()
+            drift -= await run_db(reconcile_stock_counter)
+            if drift: print(f"Stock counter reconciled, drift was {drift}.")
+            await run_db(refresh_active_assignment_count)
+        except Exception as e:
+            print(f"Stock reconcile failed: {e}")
+
+# --- মেয়াদোত্তীর্ণ অ্যাসাইনমেন্ট পরিষ্কারক ---
+async def assignment_sweeper():
+    while True:
+        await asyncio.sleep(ASSIGNMENT_SWEEP_INTERVAL)
+        try:
+            removed_count, returned_count = await run_db(sweep_expired_assignments)
+            if removed_count:
+                print(f"Assignment sweep: removed {removed_count}, returned {returned_count} to stock in {last_sweep_stats['duration_ms']:.0f} ms.")
+        except Exception as e:
+            print(f"Assignment sweep failed: {e}")
 
 # --- Render-কে সচল রাখার জন্য Flask ওয়েব সার্ভার ---
 app = Flask('')
@@ -379,20 +1153,90 @@ app = Flask('')
 def home():
     return "Bot is alive!"
 
+@app.route('/healthz')
+def healthz():
+    return {"status": "ok"}
+
+@app.route('/metrics')
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 def run():
-    # Render automatically sets the PORT environment variable
-    port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)
+    app.run(host='0.0.0.0', port=PORT)
 
 def keep_alive():
     t = Thread(target=run)
     t.start()
+
+# --- webhook মোড: Telegram update ও health রুট একই ASGI সার্ভারে ---
+def build_webhook_app(ptb_app):
+    async def telegram_webhook(request):
+        if not secrets.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), WEBHOOK_SECRET):
+            return PlainTextResponse("Forbidden", status_code=403)
+        await ptb_app.update_queue.put(Update.de_json(await request.json(), ptb_app.bot))
+        return PlainTextResponse("OK")
+
+    async def asgi_home(request):
+        return PlainTextResponse(home())
+
+    async def asgi_healthz(request):
+        return JSONResponse(healthz())
+
+    async def asgi_metrics(request):
+        return PlainTextResponse(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    return Starlette(routes=[
+        Route("/", asgi_home),
+        Route("/healthz", asgi_healthz),
+        Route("/metrics", asgi_metrics),
+        Route("/telegram", telegram_webhook, methods=["POST"]),
+    ])
     
 # --- প্রধান ফাংশন এবং বট চালু করার প্রক্রিয়া ---
-async def main():
-    keep_alive()
-    setup_database()
-    ptb_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    # আলাদা চ্যাটের update একসাথে চলে, কিন্তু একই চ্যাটের update আসার ক্রমেই চলে,
+    # নইলে উইথড্র ConversationHandler-এর ধাপগুলো এলোমেলো হয়ে যেতে পারে।
+    # PTB-র process_update চ্যাট lock-এর আগেই নিজের semaphore নেয়, তাই সেটির সীমা কার্যত অসীম রেখে
+    # আসল সীমা lock পাওয়ার পরে বসানো হয়; এক চ্যাটের জমে থাকা update অন্য চ্যাটের জায়গা আটকায় না
+    def __init__(self, max_concurrent_updates):
+        super().__init__(sys.maxsize)
+        self.handler_slots = asyncio.Semaphore(max_concurrent_updates)
+        self.chat_locks = {}
+        self.chat_pending = Counter()
+
+    async def do_process_update(self, update, coroutine):
+        chat_key = None
+        if isinstance(update, Update):
+            if update.effective_chat: chat_key = update.effective_chat.id
+            elif update.effective_user: chat_key = update.effective_user.id
+        if chat_key is None:
+            async with self.handler_slots:
+                await coroutine
+            return
+
+        lock = self.chat_locks.setdefault(chat_key, asyncio.Lock())
+        self.chat_pending[chat_key] += 1
+        try:
+            async with lock, self.handler_slots:
+                await coroutine
+        finally:
+            self.chat_pending[chat_key] -= 1
+            if not self.chat_pending[chat_key]:
+                del self.chat_pending[chat_key]
+                del self.chat_locks[chat_key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def build_ptb_app(bot=None):
+    # webhook মোডে বিভিন্ন চ্যাটের update একসাথে প্রসেস হয়; polling মোডে আগের মতো একটার পর একটা।
+    # bot দিলে টোকেনের বদলে সেটি ব্যবহার হয় (লোড-টেস্টের stub Bot)
+    update_processor = PerChatUpdateProcessor(WEBHOOK_CONCURRENCY) if WEBHOOK_URL else False
+    builder = Application.builder().bot(bot) if bot else Application.builder().token(TELEGRAM_BOT_TOKEN)
+    ptb_app = builder.concurrent_updates(update_processor).build()
 
     withdraw_handler = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex(f'^{BTN_WITHDRAW}$'), handle_withdraw_message)],
@@ -403,7 +1247,7 @@ async def main():
         },
         fallbacks=[CommandHandler('cancel', cancel_withdraw)], per_message=False
     )
-    
+
     ptb_app.add_handler(CommandHandler("start", start_command))
     ptb_app.add_handler(MessageHandler(filters.Regex(f'^{BTN_GET_NUMBER}$'), handle_get_number_message))
     ptb_app.add_handler(MessageHandler(filters.Regex(f'^{BTN_ACCOUNT}$'), handle_account_message))
@@ -411,50 +1255,72 @@ async def main():
     ptb_app.add_handler(withdraw_handler)
     ptb_app.add_handler(CallbackQueryHandler(refresh_button_callback, pattern='^refresh_button$'))
     ptb_app.add_handler(CommandHandler("add", add_command))
+    ptb_app.add_handler(MessageHandler(filters.Document.ALL & filters.User(ADMIN_USER_ID), add_file_command))
     ptb_app.add_handler(CommandHandler("delete", delete_command))
     ptb_app.add_handler(CommandHandler("clearall", clearall_command))
     ptb_app.add_handler(CommandHandler("stats", stats_command))
     ptb_app.add_handler(CommandHandler("broadcast", broadcast_command))
-    
+    ptb_app.add_handler(CommandHandler("dbstats", dbstats_command))
+    return ptb_app
+
+async def run_channel_listener():
+    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+    client.add_event_handler(forwarder_handler, events.NewMessage(chats=SOURCE_CHANNEL))
+
+    await client.start()
+    print("Telethon user client successfully started.")
+    await client.run_until_disconnected()
+
+async def run_delivery_worker():
+    bot = Bot(TELEGRAM_BOT_TOKEN)
+    async with bot:
+        start_otp_pipeline(bot)
+        print("OTP delivery worker successfully started.")
+        await otp_event_consumer()
+
+async def main():
+    setup_database()
+    refresh_active_assignment_count()
+    if BOT_ROLE in ("listener", "delivery"):
+        # এই প্রসেসগুলোতে Flask বা webhook সার্ভার চলে না, তাই /metrics-এর জন্য আলাদা HTTP সার্ভার
+        start_http_server(PORT)
+        reconcile_stock_counter()
+        reconciler_task = asyncio.create_task(stock_reconciler())
+        await (run_channel_listener() if BOT_ROLE == "listener" else run_delivery_worker())
+        return
+
+    if not WEBHOOK_URL:
+        keep_alive()
+    if ASSIGNMENT_INDEX_ENABLED:
+        print(f"Assignment index loaded with {load_assignment_index()} active numbers.")
+    print(f"Stock counter loaded with {reconcile_stock_counter()} numbers.")
+    ptb_app = build_ptb_app()
+
     async with ptb_app:
         await ptb_app.start()
+        if WEBHOOK_URL:
+            await ptb_app.bot.set_webhook(url=f"{WEBHOOK_URL}/telegram", secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+            web_server = uvicorn.Server(uvicorn.Config(build_webhook_app(ptb_app), host="0.0.0.0", port=PORT, log_level="warning"))
+            web_server_task = asyncio.create_task(web_server.serve())
+        else:
+            await ptb_app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
         print("Telegram PTB bot successfully started.")
-        
-        client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
-        
-        @client.on(events.NewMessage(chats=SOURCE_CHANNEL))
-        async def forwarder_handler(event):
-            message_text = event.message.text
-            if not message_text: return
-            
-            numbers_in_message = re.findall(r'(\+?\d[ \d\-\(\)]{8,}\d)', message_text)
-            if not numbers_in_message: return
-
-            for raw_number in numbers_in_message:
-                cleaned_number = clean_phone_number(raw_number)
-                assigned_user_id = get_assigned_user(cleaned_number)
-
-                if assigned_user_id:
-                    try:
-                        final_message = (
-                            f"🔑 **OTP Alert!**\n\n"
-                            f"**From:** `{raw_number}`\n\n"
-                            f"**Message:**\n`{message_text}`"
-                        )
-                        await ptb_app.bot.send_message(
-                            chat_id=assigned_user_id,
-                            text=final_message,
-                            parse_mode='Markdown'
-                        )
-                        update_user_balance(assigned_user_id, BALANCE_PER_OTP)
-                        remove_assignment(cleaned_number)
-                        print(f"OTP successfully forwarded to user {assigned_user_id}.")
-                    except Exception as e:
-                        print(f"Failed to send message to user {assigned_user_id}: {e}")
-
-        await client.start()
-        print("Telethon user client successfully started.")
-        await client.run_until_disconnected()
+
+        sweeper_task = asyncio.create_task(assignment_sweeper())
+        reconciler_task = asyncio.create_task(stock_reconciler())
+        try:
+            if BOT_ROLE == "bot":
+                await asyncio.Event().wait()
+            else:
+                start_otp_pipeline(ptb_app.bot)
+                await run_channel_listener()
+        finally:
+            if WEBHOOK_URL:
+                web_server.should_exit = True
+                await web_server_task
+            else:
+                await ptb_app.updater.stop()
+            await ptb_app.stop()
 
 if __name__ == "__main__":
     print("Starting bot...")
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# main.py ইমপোর্টের আগেই অফলাইন কনফিগারেশন সেট করতে হয়; প্রতিটি টেস্ট রানে আলাদা SQLite ফাইল
+os.environ["BOT_OFFLINE"] = "1"
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='otp-bot-tests-'), 'test.db')}"
+os.environ.setdefault("ADMIN_USER_ID", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def bot_main():
+    import main
+    main.setup_database()
+    return main
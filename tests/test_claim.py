@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+STOCK = 1_000
+
+
+@pytest.mark.parametrize("claim_mode", ["random", "fifo"])
+def test_concurrent_claims_never_share_a_number(bot_main, monkeypatch, claim_mode):
+    monkeypatch.setattr(bot_main, "NUMBER_CLAIM_MODE", claim_mode)
+    bot_main.clear_all_numbers_from_db()
+    stocked = {str(8801300000000 + offset) for offset in range(STOCK)}
+    assert bot_main.add_numbers_to_db(sorted(stocked)) == (STOCK, 0, 0)
+
+    # স্টকের চেয়ে বেশি ইউজার একসাথে চাপলে কেউ কেউ খালি হাতে ফেরে, কিন্তু কেউ একই নাম্বার পায় না
+    user_ids = range(7_000_000, 7_000_000 + STOCK + 300)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        claimed = [number for number in pool.map(bot_main.reserve_number_for_user, user_ids) if number]
+
+    assert len(claimed) == len(set(claimed)) == STOCK
+    assert set(claimed) == stocked
+    assert bot_main.reserve_number_for_user(7_999_999) is None
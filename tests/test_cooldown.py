@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+class StubMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def press_get_number(bot_main, user_id):
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=StubMessage())
+    asyncio.run(bot_main.handle_get_number_message(update, SimpleNamespace(bot=None)))
+    return update.message.replies
+
+
+def test_failed_claim_releases_the_cooldown(bot_main, monkeypatch):
+    user_id = 9_100_000_001
+    bot_main.add_numbers_to_db(["8801911000001"])
+
+    def broken_reserve(user_id):
+        raise OperationalError("DELETE FROM numbers", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(bot_main, "reserve_number_for_user", broken_reserve)
+    with pytest.raises(OperationalError):
+        press_get_number(bot_main, user_id)
+
+    monkeypatch.undo()
+    replies = press_get_number(bot_main, user_id)
+    assert replies and "অপেক্ষা" not in replies[0]
+    assert "অপেক্ষা" in press_get_number(bot_main, user_id)[0]
@@ -0,0 +1,41 @@
+import json
+import os
+import re
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+with open(os.path.join(os.path.dirname(__file__), "data", "otp_messages.json"), encoding="utf-8") as f:
+    OTP_MESSAGES = json.load(f)
+
+
+def legacy_extract_phone_numbers(message_text):
+    # অপ্টিমাইজেশনের আগের forwarder-এর পদ্ধতি: প্রতিবার regex কম্পাইল ও প্রতিটি ম্যাচে আলাদা re.sub
+    found = {}
+    for raw_number in re.findall(r'(\+?\d[ \d\-\(\)]{8,}\d)', message_text):
+        found.setdefault(re.sub(r'\D', '', raw_number), raw_number)
+    return [(raw_number, cleaned_number) for cleaned_number, raw_number in found.items()]
+
+
+def extract_corpus(extract):
+    return [extract(message_text) for message_text in OTP_MESSAGES]
+
+
+def test_extractor_matches_legacy_on_corpus(bot_main, monkeypatch):
+    monkeypatch.setattr(bot_main, "PHONE_FAST_PATH", False)
+    assert extract_corpus(bot_main.extract_phone_numbers) == extract_corpus(legacy_extract_phone_numbers)
+
+
+def test_benchmark_legacy_extractor(benchmark):
+    benchmark(extract_corpus, legacy_extract_phone_numbers)
+
+
+def test_benchmark_extractor(bot_main, benchmark, monkeypatch):
+    monkeypatch.setattr(bot_main, "PHONE_FAST_PATH", False)
+    benchmark(extract_corpus, bot_main.extract_phone_numbers)
+
+
+def test_benchmark_extractor_fast_path(bot_main, benchmark, monkeypatch):
+    monkeypatch.setattr(bot_main, "PHONE_FAST_PATH", True)
+    benchmark(extract_corpus, bot_main.extract_phone_numbers)
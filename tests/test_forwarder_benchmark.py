@@ -0,0 +1,47 @@
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+with open(os.path.join(os.path.dirname(__file__), "data", "otp_messages.json"), encoding="utf-8") as f:
+    OTP_MESSAGES = json.load(f)
+
+# চ্যানেলের নাম্বারগুলোর বাইরে কিছু সক্রিয় অ্যাসাইনমেন্ট, যাতে টেবিল ও ইনডেক্স ফাঁকা না থাকে
+OTHER_ASSIGNMENTS = {str(8801200000000 + offset): 8_000_000 + offset for offset in range(1_000)}
+
+
+@pytest.fixture(scope="module")
+def active_assignments(bot_main):
+    with bot_main.db_session() as db:
+        db.query(bot_main.ActiveAssignment).delete()
+        db.execute(bot_main.insert(bot_main.ActiveAssignment), [
+            {"number": number, "user_id": user_id, "timestamp": time.time()} for number, user_id in OTHER_ASSIGNMENTS.items()
+        ])
+    return OTHER_ASSIGNMENTS
+
+
+@pytest.mark.parametrize("index_enabled", [True, False], ids=["with_index", "without_index"])
+def test_benchmark_forwarder_unassigned_numbers(bot_main, benchmark, monkeypatch, active_assignments, index_enabled):
+    # চ্যানেলের বেশিরভাগ নাম্বার কারো নামে থাকে না; ইনডেক্স থাকলে সেগুলো মেমোরিতেই বাদ পড়ে,
+    # না থাকলে প্রতিটি নাম্বারের জন্য SQLite-এ get_assigned_user চলে
+    monkeypatch.setattr(bot_main, "ASSIGNMENT_INDEX_ENABLED", index_enabled)
+    monkeypatch.setattr(bot_main, "BOT_ROLE", "all")
+    monkeypatch.setattr(bot_main, "assignment_index", dict(active_assignments) if index_enabled else {})
+    events = [SimpleNamespace(message=SimpleNamespace(text=message_text)) for message_text in OTP_MESSAGES]
+    loop = asyncio.new_event_loop()
+
+    async def forward_corpus():
+        for channel_event in events:
+            await bot_main.forwarder_handler(channel_event)
+
+    try:
+        benchmark(lambda: loop.run_until_complete(forward_corpus()))
+    finally:
+        loop.close()
+    benchmark.extra_info["messages_per_s"] = len(events) / benchmark.stats.stats.mean
+    assert bot_main.otp_delivery_queue.empty()
@@ -0,0 +1,32 @@
+def stocked_numbers(bot_main):
+    with bot_main.db_session() as db:
+        return {row.number for row in db.query(bot_main.Number.number).all()}
+
+
+def test_space_separated_numbers_are_split(bot_main):
+    assert bot_main.split_number_tokens("8801711000001 8801711000002\n") == ["8801711000001", "8801711000002"]
+    assert bot_main.split_number_tokens("+880 1711-000003, 8801711000004") == ["+880 1711-000003", " 8801711000004"]
+
+
+def test_import_rejects_short_and_overlong_entries(bot_main, tmp_path):
+    bot_main.clear_all_numbers_from_db()
+    path = tmp_path / "numbers.csv"
+    path.write_text(
+        "8801711000001 8801711000002\n"
+        "+880 1711-000003;1;12345\n"
+        "8801711000001,,\n"
+        "1234567890123456789\n"
+    )
+    assert bot_main.import_numbers_file(str(path)) == (3, 1, 3)
+    assert stocked_numbers(bot_main) == {"8801711000001", "8801711000002", "8801711000003"}
+
+
+def test_huge_line_is_imported_in_bounded_batches(bot_main, monkeypatch, tmp_path):
+    monkeypatch.setattr(bot_main, "BULK_INSERT_BATCH_SIZE", 1_000)
+    bot_main.clear_all_numbers_from_db()
+    numbers = [str(8801600000000 + offset) for offset in range(2_500)]
+    assert [len(batch) for batch in bot_main.iter_number_batches([",".join(numbers)])] == [1_000, 1_000, 500]
+
+    path = tmp_path / "one_line.csv"
+    path.write_text(" ".join(numbers))
+    assert bot_main.import_numbers_file(str(path)) == (2_500, 0, 0)
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+USER_IDS = [5_000_000_001, 5_000_000_002, 5_000_000_003, 5_000_000_004]
+OPENING_BALANCE = 50_00
+OPERATIONS_PER_USER = 1_000
+
+
+def ledger_total(bot_main, user_id):
+    with bot_main.db_session() as db:
+        return db.query(func.coalesce(func.sum(bot_main.BalanceLedger.amount_poisha), 0)).filter(bot_main.BalanceLedger.user_id == user_id).scalar()
+
+
+def test_parallel_credits_and_debits_keep_every_poisha(bot_main):
+    for user_id in USER_IDS:
+        bot_main.add_or_update_user(user_id)
+    with bot_main.db_session() as db:
+        bot_main.credit_user_balances(db, {user_id: OPENING_BALANCE for user_id in USER_IDS}, "opening_balance")
+
+    def credit(user_id):
+        with bot_main.db_session() as db:
+            bot_main.credit_user_balances(db, {user_id: bot_main.BALANCE_PER_OTP_POISHA}, "otp")
+        return user_id, bot_main.BALANCE_PER_OTP_POISHA
+
+    def debit(user_id):
+        # প্রতিটি ডেবিট ক্রেডিটের চেয়ে বড়, তাই অনেকগুলো ব্যালেন্সের অভাবে ব্যর্থ হয়
+        amount_poisha = 3 * bot_main.BALANCE_PER_OTP_POISHA
+        return user_id, -amount_poisha if bot_main.debit_user_balance(user_id, amount_poisha, "withdraw_recharge") else 0
+
+    jobs = [(operation, user_id) for user_id in USER_IDS for _ in range(OPERATIONS_PER_USER) for operation in (credit, debit)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda job: job[0](job[1]), jobs))
+
+    for user_id in USER_IDS:
+        expected_poisha = OPENING_BALANCE + sum(amount for result_user_id, amount in results if result_user_id == user_id)
+        assert expected_poisha >= 0
+        assert round(bot_main.get_user_balance(user_id) * 100) == expected_poisha
+        assert ledger_total(bot_main, user_id) == expected_poisha
+
+
+def test_overdraft_is_refused(bot_main):
+    user_id = 5_000_000_100
+    bot_main.add_or_update_user(user_id)
+    assert not bot_main.debit_user_balance(user_id, 1, "withdraw_recharge")
+    assert bot_main.get_user_balance(user_id) == 0
+    assert ledger_total(bot_main, user_id) == 0
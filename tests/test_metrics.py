@@ -0,0 +1,37 @@
+import time
+
+import pytest
+from prometheus_client import generate_latest
+from sqlalchemy import text
+
+
+def metric_value(name):
+    for line in generate_latest().decode().splitlines():
+        if line.startswith(f"{name} "):
+            return float(line.split()[1])
+    raise AssertionError(f"{name} not exported")
+
+
+def test_active_assignments_gauge_counts_the_table(bot_main, monkeypatch):
+    # ইনডেক্স খালি থাকলেও (listener/delivery রোল, বা পাঠানোর জন্য সরিয়ে নেওয়া নাম্বার) গেজ টেবিলের হিসাব দেখায়
+    monkeypatch.setattr(bot_main, "assignment_index", {})
+    with bot_main.db_session() as db:
+        db.query(bot_main.ActiveAssignment).delete()
+        db.execute(bot_main.insert(bot_main.ActiveAssignment), [
+            {"number": str(8801100000000 + offset), "user_id": 9_000_000 + offset, "timestamp": time.time()} for offset in range(3)
+        ])
+    assert bot_main.refresh_active_assignment_count() == 3
+    assert metric_value("bot_active_assignments") == 3
+
+
+def test_failed_query_does_not_skew_the_next_timing(bot_main):
+    count_before = metric_value("bot_db_query_seconds_count")
+    with pytest.raises(Exception):
+        with bot_main.db_session() as db:
+            db.execute(text("SELECT * FROM no_such_table"))
+    time.sleep(0.2)
+    sum_before = metric_value("bot_db_query_seconds_sum")
+    with bot_main.db_session() as db:
+        db.execute(text("SELECT 1"))
+    assert metric_value("bot_db_query_seconds_count") > count_before
+    assert metric_value("bot_db_query_seconds_sum") - sum_before < 0.1
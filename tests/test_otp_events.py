@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter, TimedOut
+
+
+def add_event(bot_main, user_id, number):
+    bot_main.add_or_update_user(user_id)
+    bot_main.assign_number_to_user(number, user_id)
+    assert bot_main.enqueue_otp_events([(f"+{number}", number)], "code 482-913", time.time()) == 1
+    with bot_main.db_session() as db:
+        return db.query(bot_main.OtpEvent.id).filter(bot_main.OtpEvent.number == number).scalar()
+
+
+def event_row(bot_main, event_id):
+    with bot_main.db_session() as db:
+        return db.query(bot_main.OtpEvent.attempts, bot_main.OtpEvent.claimed_until).filter(bot_main.OtpEvent.id == event_id).first()
+
+
+def clear_events(bot_main):
+    with bot_main.db_session() as db:
+        db.query(bot_main.OtpEvent).delete()
+
+
+def run_delivery(bot_main, monkeypatch, bot, otp_events):
+    async def scenario():
+        monkeypatch.setattr(bot_main, "otp_delivery_queue", asyncio.Queue())
+        monkeypatch.setattr(bot_main, "otp_settle_queue", asyncio.Queue())
+        worker = asyncio.create_task(bot_main.otp_delivery_worker(bot))
+        for event_id, user_id, raw_number, cleaned_number, message_text, received_at in otp_events:
+            await bot_main.otp_delivery_queue.put((user_id, raw_number, cleaned_number, message_text, received_at, event_id))
+        await bot_main.otp_delivery_queue.join()
+        worker.cancel()
+    asyncio.run(scenario())
+
+
+class FailingBot:
+    def __init__(self, error):
+        self.error = error
+
+    async def send_message(self, **kwargs):
+        raise self.error
+
+
+def test_event_is_dropped_after_max_attempts(bot_main, monkeypatch):
+    clear_events(bot_main)
+    monkeypatch.setattr(bot_main, "OTP_EVENT_VISIBILITY_TIMEOUT", -1)
+    event_id = add_event(bot_main, 6_000_000_001, "8801611000001")
+
+    for attempt in range(1, bot_main.OTP_EVENT_MAX_ATTEMPTS + 1):
+        otp_events = bot_main.claim_otp_events(10)
+        assert [row[0] for row in otp_events] == [event_id]
+        run_delivery(bot_main, monkeypatch, FailingBot(TimedOut()), otp_events)
+        assert event_row(bot_main, event_id).attempts == attempt
+
+    assert bot_main.claim_otp_events(10) == []
+    assert event_row(bot_main, event_id) is None
+
+
+def test_retry_after_postpones_the_event(bot_main, monkeypatch):
+    clear_events(bot_main)
+    event_id = add_event(bot_main, 6_000_000_002, "8801611000002")
+    otp_events = bot_main.claim_otp_events(10)
+    run_delivery(bot_main, monkeypatch, FailingBot(RetryAfter(5)), otp_events)
+
+    attempts, claimed_until = event_row(bot_main, event_id)
+    assert attempts == 1
+    assert 3 < claimed_until - time.time() <= 5
@@ -0,0 +1,74 @@
+import tracemalloc
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+pytest.importorskip("pytest_benchmark")
+
+FIRST_NAME, FULL_NAME, USER_ID = "Rahim", "Rahim Uddin", 5_123_456_789
+NUMBER, BALANCE = "8801711000001", 12.6
+RAW_NUMBER, MESSAGE_TEXT = "+880 1711-000001", "Your WhatsApp code 482-913"
+
+
+def legacy_replies(bot_main):
+    # আগের হ্যান্ডলারগুলো যেভাবে প্রতি রিকোয়েস্টে কীবোর্ড ও মেসেজ বানাত (start, Get Number, উইথড্র মেনু, OTP)
+    MIN_WITHDRAW = bot_main.MIN_WITHDRAW
+    keyboard = [[KeyboardButton(bot_main.BTN_GET_NUMBER)], [KeyboardButton(bot_main.BTN_ACCOUNT), KeyboardButton(bot_main.BTN_BALANCE)], [KeyboardButton(bot_main.BTN_WITHDRAW)]]
+    start = (f"Hi👋, {FIRST_NAME}!\n\n📞 নাম্বার পেতে Get Number-এ ক্লিক করুন।", ReplyKeyboardMarkup(keyboard, resize_keyboard=True))
+    number = (
+        f"📞 আপনার নাম্বার: `{NUMBER}`\n\n🔐 এই নাম্বারে OTP এলে এখানেই পাবেন।\n🚫 না এলে অন্য নাম্বার ট্রাই করুন।\n\n💸 প্রতি OTP-তে আপনার ব্যালেন্সে 0.60 টাকা যোগ হবে।\n💳 20 টাকা হলেই Withdraw করা যাবে।",
+        InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Refresh", callback_data="refresh_button")]]),
+    )
+    keyboard = [
+        [InlineKeyboardButton(f"📱 Mobile Recharge (min {MIN_WITHDRAW['recharge']} টাকা)", callback_data='withdraw_recharge')],
+        [InlineKeyboardButton(f"🚀 Rocket (min {MIN_WITHDRAW['rocket']} টাকা)", callback_data='withdraw_rocket')],
+        [InlineKeyboardButton(f"🔶 Binance (min {MIN_WITHDRAW['binance']} USD)", callback_data='withdraw_binance')],
+        [InlineKeyboardButton("❌ Cancel", callback_data='withdraw_cancel')]
+    ]
+    withdraw = (f"আপনার বর্তমান ব্যালেন্স: **{BALANCE:.2f}** টাকা।\n\nআপনি কোন মাধ্যমে টাকা তুলতে চান? অনুগ্রহ করে নিচের একটি অপশন বেছে নিন:", InlineKeyboardMarkup(keyboard))
+    account = (f"👤 **Account Info**\n\n- **Name:** {FULL_NAME}\n- **User ID:** `{USER_ID}`", None)
+    otp = (f"🔑 **OTP Alert!**\n\n" f"**From:** `{RAW_NUMBER}`\n\n" f"**Message:**\n`{MESSAGE_TEXT}`", None)
+    return start, number, withdraw, account, otp
+
+
+def template_replies(bot_main):
+    return (
+        (bot_main.START_TEMPLATE.format(first_name=FIRST_NAME), bot_main.MAIN_MENU_MARKUP),
+        (bot_main.NUMBER_ASSIGNED_TEMPLATE.format(number=NUMBER), bot_main.REFRESH_MARKUP),
+        (bot_main.WITHDRAW_MENU_TEMPLATE.format(balance=BALANCE), bot_main.WITHDRAW_METHOD_MARKUP),
+        (bot_main.ACCOUNT_TEMPLATE.format(full_name=FULL_NAME, user_id=USER_ID), None),
+        (bot_main.OTP_ALERT_TEMPLATE.format(raw_number=RAW_NUMBER, message_text=MESSAGE_TEXT), None),
+    )
+
+
+def retained_bytes_per_call(build, bot_main, calls=2_000):
+    # ফলাফলগুলো ধরে রেখে মাপা হয়, যেমন পাঠানোর আগ পর্যন্ত হ্যান্ডলারে থাকে
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        replies = [build(bot_main) for _ in range(calls)]
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(replies) == calls
+    return (after - before) / calls
+
+
+def test_templates_render_the_same_replies(bot_main):
+    for (legacy_text, legacy_markup), (text, markup) in zip(legacy_replies(bot_main), template_replies(bot_main)):
+        assert text == legacy_text
+        assert (markup.to_dict() if markup else None) == (legacy_markup.to_dict() if legacy_markup else None)
+
+
+def test_templates_allocate_less_than_inline_markup(bot_main):
+    assert retained_bytes_per_call(template_replies, bot_main) < retained_bytes_per_call(legacy_replies, bot_main) / 2
+
+
+def test_benchmark_inline_markup(bot_main, benchmark):
+    benchmark.extra_info["retained_bytes_per_call"] = retained_bytes_per_call(legacy_replies, bot_main)
+    benchmark(legacy_replies, bot_main)
+
+
+def test_benchmark_prebuilt_markup_and_templates(bot_main, benchmark):
+    benchmark.extra_info["retained_bytes_per_call"] = retained_bytes_per_call(template_replies, bot_main)
+    benchmark(template_replies, bot_main)
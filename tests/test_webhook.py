@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from telegram import Update
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": "📱 Get Number",
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+        },
+    }, None)
+
+
+def test_burst_from_one_chat_does_not_block_other_chats(bot_main):
+    async def scenario():
+        processor = bot_main.PerChatUpdateProcessor(4)
+        finished = []
+
+        async def handle(update_id, seconds):
+            await asyncio.sleep(seconds)
+            finished.append((update_id, time.perf_counter()))
+
+        # একটি চ্যাট থেকে সীমার অনেক বেশি update একসাথে
+        burst = [asyncio.ensure_future(processor.process_update(make_update(update_id, 7), handle(update_id, 0.05))) for update_id in range(20)]
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        await processor.process_update(make_update(100, 8), handle(100, 0))
+        other_chat_seconds = time.perf_counter() - started
+        await asyncio.gather(*burst)
+        return finished, other_chat_seconds, processor
+
+    finished, other_chat_seconds, processor = asyncio.run(scenario())
+    assert other_chat_seconds < 0.05
+    assert [update_id for update_id, _ in finished if update_id != 100] == list(range(20))
+    assert not processor.chat_locks and not processor.chat_pending
+
+
+def test_concurrency_limit_applies_across_chats(bot_main):
+    async def scenario():
+        processor = bot_main.PerChatUpdateProcessor(3)
+        running, peak = 0, 0
+
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(processor.process_update(make_update(chat_id, chat_id), handle()) for chat_id in range(1, 20)))
+        return peak
+
+    assert asyncio.run(scenario()) == 3